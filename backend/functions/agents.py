@@ -1,20 +1,7 @@
-import os
 from smolagents import Tool, ToolCallingAgent, LiteLLMModel
-from .text_embedding import Embeddings
-from .audio_processing import Audio
-from .image_processing import ImageProcessing
-from .chroma_db import VectorDB
-from supabase import create_client, Client
 from .utils import vectordb_output_processing
-
-vector_db = VectorDB()
-text_embedding = Embeddings()
-audio_process = Audio()
-image_process = ImageProcessing()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+from .services import get_vector_db, get_embeddings, get_supabase, get_reranker
+from .text_embedding import SEARCH_TOP_K
 
 
 class CaseDetailsTool(Tool):
@@ -25,7 +12,7 @@ class CaseDetailsTool(Tool):
     
     def forward(self, case_id: str) -> str:
         # Get all chunks for this case from ChromaDB
-        case_results = vector_db.collection.get(
+        case_results = get_vector_db().get(
             where={"case_id": case_id},
             include=["documents", "metadatas"]
         )
@@ -34,6 +21,7 @@ class CaseDetailsTool(Tool):
             return f"Case {case_id} not found"
         
         # Get tasks and files from Supabase
+        supabase = get_supabase()
         tasks = supabase.table('tasks').select("*").eq('case_id', case_id).execute()
         files = supabase.table('files').select("*").eq('case_id', case_id).execute()
         
@@ -82,13 +70,32 @@ class CaseDetailsTool(Tool):
 
 class SearchDocumentsTool(Tool):
     name = "search_documents"
-    description = "Search across all construction documents, tasks, and content"
-    inputs = {"query": {"type": "string", "description": "Search query"}}
+    description = "Search construction documents, tasks, and content, optionally restricted to one case, content type or file"
+    inputs = {
+        "query": {"type": "string", "description": "Search query"},
+        "case_id": {"type": "string", "description": "Optional case ID to search within", "nullable": True},
+        "doc_type": {
+            "type": "string",
+            "description": "Optional content type: document, audio_transcription, image or task",
+            "nullable": True
+        },
+        "filename": {"type": "string", "description": "Optional original filename to search within", "nullable": True},
+        "k": {"type": "integer", "description": f"Optional number of results (default {SEARCH_TOP_K})", "nullable": True}
+    }
     output_type = "string"
     
-    def forward(self, query: str) -> str:
+    def forward(self, query: str, case_id: str = None, doc_type: str = None, filename: str = None, k: int = None) -> str:
         # Use existing search logic
-        output = text_embedding.get_query(query)
+        text_embedding = get_embeddings()
+        reranker = get_reranker()
+        if reranker:
+            # Over-fetch, then keep only the chunks the cross-encoder ranks best
+            top_n = k or reranker.top_n
+            output = text_embedding.get_query(query, case_id=case_id, doc_type=doc_type, filename=filename,
+                                              k=max(reranker.candidates, top_n))
+            output = reranker.rerank_results(query, output, top_n=top_n)
+        else:
+            output = text_embedding.get_query(query, case_id=case_id, doc_type=doc_type, filename=filename, k=k or SEARCH_TOP_K)
         processed = vectordb_output_processing(output)
         result = text_embedding.llm_processing(processed, query)
         
@@ -101,7 +108,7 @@ class ListCasesTool(Tool):
     output_type = "string"
     
     def forward(self) -> str:
-        cases = supabase.table('cases').select("id, created_at").execute()
+        cases = get_supabase().table('cases').select("id, created_at").execute()
         case_list = [f"- {c['id']} (created: {c['created_at']})" for c in cases.data]
         return f"Available cases ({len(cases.data)} total):\n" + "\n".join(case_list)
 
@@ -114,7 +121,7 @@ class TaskAnalysisTool(Tool):
     output_type = "string"
     
     def forward(self, case_id: str = None) -> str:
-        query = supabase.table('tasks').select("*")
+        query = get_supabase().table('tasks').select("*")
         if case_id:
             query = query.eq('case_id', case_id)
         
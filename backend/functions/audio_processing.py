@@ -1,28 +1,211 @@
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from pydub import AudioSegment
+from pydub.silence import detect_silence, detect_nonsilent
+from .executor import run_blocking
+from .services import get_async_openai
 
-load_dotenv()
+# Whisper rejects uploads over 25 MB; files above this are split before transcription
+AUDIO_MAX_UPLOAD_MB = float(os.getenv("AUDIO_MAX_UPLOAD_MB", 24))
+# Target length of one segment; cuts are made at the last silence before it
+AUDIO_SEGMENT_SECONDS = int(os.getenv("AUDIO_SEGMENT_SECONDS", 600))
+# Segments transcribed or cleaned at once for a single recording
+AUDIO_SEGMENT_CONCURRENCY = int(os.getenv("AUDIO_SEGMENT_CONCURRENCY", 4))
+# A pause must be at least this long, and this far below the average loudness, to cut on
+AUDIO_MIN_SILENCE_MS = int(os.getenv("AUDIO_MIN_SILENCE_MS", 700))
+AUDIO_SILENCE_DB_BELOW_AVERAGE = float(os.getenv("AUDIO_SILENCE_DB_BELOW_AVERAGE", 16))
+# Step between loudness measurements when looking for pauses; 1 ms is needlessly slow on long recordings
+AUDIO_SILENCE_SEEK_MS = int(os.getenv("AUDIO_SILENCE_SEEK_MS", 20))
+
+# Downmix, resample, re-encode and trim silence locally before anything is sent to Whisper
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "true").lower() == "true"
+AUDIO_PREPROCESS_SAMPLE_RATE = int(os.getenv("AUDIO_PREPROCESS_SAMPLE_RATE", 16000))
+AUDIO_PREPROCESS_BITRATE = os.getenv("AUDIO_PREPROCESS_BITRATE", "32k")
+# Voice activity detection: pauses longer than this are cut, keeping some padding around speech
+AUDIO_VAD_MIN_SILENCE_MS = int(os.getenv("AUDIO_VAD_MIN_SILENCE_MS", 1500))
+AUDIO_VAD_PADDING_MS = int(os.getenv("AUDIO_VAD_PADDING_MS", 300))
+
+
+def detect_speech(audio: AudioSegment) -> List[Tuple[int, int]]:
+    """
+    Energy-based voice activity detection.
+
+    Returns the (start, end) ms ranges that are louder than the silence
+    threshold, padded by AUDIO_VAD_PADDING_MS and merged where they overlap.
+    """
+    ranges = detect_nonsilent(
+        audio,
+        min_silence_len=AUDIO_VAD_MIN_SILENCE_MS,
+        silence_thresh=audio.dBFS - AUDIO_SILENCE_DB_BELOW_AVERAGE,
+        seek_step=10
+    )
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        start, end = max(0, start - AUDIO_VAD_PADDING_MS), min(len(audio), end + AUDIO_VAD_PADDING_MS)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def preprocess_audio(audio: AudioSegment, file_path: str, out_dir: str) -> Dict:
+    """
+    Prepare a decoded recording for transcription: mono, resampled, compact mp3, silence trimmed.
+
+    Returns the prepared audio and the path it was exported to (None when
+    no speech was detected), the speech regions kept (ms in the original
+    recording, for mapping timestamps back with to_original_time) and the
+    byte and duration savings.
+    """
+    original_ms = len(audio)
+    audio = audio.set_channels(1).set_frame_rate(AUDIO_PREPROCESS_SAMPLE_RATE)
+
+    regions = detect_speech(audio)
+    # Joined in one go; appending segment by segment copies the whole recording every time
+    audio = audio._spawn(b"".join(audio[start:end].raw_data for start, end in regions))
+
+    path = None
+    if regions:
+        path = os.path.join(out_dir, "prepared.mp3")
+        audio.export(path, format="mp3", bitrate=AUDIO_PREPROCESS_BITRATE)
+
+    original_bytes = os.path.getsize(file_path)
+    processed_bytes = os.path.getsize(path) if path else 0
+    return {
+        "audio": audio,
+        "path": path,
+        "regions": regions,
+        "original_bytes": original_bytes,
+        "processed_bytes": processed_bytes,
+        "bytes_saved": original_bytes - processed_bytes,
+        "original_seconds": original_ms / 1000,
+        "processed_seconds": len(audio) / 1000,
+        "seconds_saved": (original_ms - len(audio)) / 1000
+    }
+
+
+def to_original_time(seconds: float, regions: List[Tuple[int, int]]) -> float:
+    """Map a time in a silence-trimmed recording back to the original recording"""
+    remaining_ms = seconds * 1000
+    for start, end in regions:
+        if remaining_ms <= end - start:
+            return (start + remaining_ms) / 1000
+        remaining_ms -= end - start
+    return regions[-1][1] / 1000 if regions else seconds
+
+
+def plan_cuts(duration_ms: int, silences: List[List[int]], segment_ms: int) -> List[int]:
+    """
+    Choose cut points so that no segment is longer than segment_ms.
+
+    Each cut is placed in the middle of the last silence that ends a segment
+    in time, or exactly at segment_ms when there is no such silence.
+    """
+    midpoints = [(start + end) // 2 for start, end in silences]
+    cuts = [0]
+    while duration_ms - cuts[-1] > segment_ms:
+        limit = cuts[-1] + segment_ms
+        candidates = [m for m in midpoints if cuts[-1] < m <= limit]
+        cuts.append(candidates[-1] if candidates else limit)
+    cuts.append(duration_ms)
+    return cuts
+
+
+def split_audio(audio: AudioSegment, out_dir: str, file_path: Optional[str] = None) -> List[Dict]:
+    """
+    Split a decoded recording on silence into segments that fit in one Whisper request.
+
+    A short recording is returned as a single segment pointing at file_path,
+    the file it was decoded from, and an empty recording as no segments.
+    Returns dicts with path, start and end (seconds), in order.
+    """
+    duration_ms = len(audio)
+    segment_ms = AUDIO_SEGMENT_SECONDS * 1000
+
+    if duration_ms == 0:
+        return []
+    if file_path and os.path.getsize(file_path) <= AUDIO_MAX_UPLOAD_MB * 1024 * 1024 and duration_ms <= segment_ms:
+        return [{"path": file_path, "start": 0.0, "end": duration_ms / 1000}]
+
+    silences = detect_silence(
+        audio,
+        min_silence_len=AUDIO_MIN_SILENCE_MS,
+        silence_thresh=audio.dBFS - AUDIO_SILENCE_DB_BELOW_AVERAGE,
+        seek_step=AUDIO_SILENCE_SEEK_MS
+    )
+    cuts = plan_cuts(duration_ms, silences, segment_ms)
+
+    segments = []
+    for i, (start, end) in enumerate(zip(cuts, cuts[1:])):
+        path = os.path.join(out_dir, f"segment_{i:04d}.mp3")
+        # Compact mono mp3 keeps a full-length segment far below the upload limit
+        audio[start:end].set_channels(1).export(path, format="mp3", bitrate="64k")
+        segments.append({"path": path, "start": start / 1000, "end": end / 1000})
+    return segments
 
-OPENAI_API_KEY = os.getenv("OPENAI_API")
-client = OpenAI(api_key = OPENAI_API_KEY)
 
 class Audio:
     def __init__(self, model="whisper-1", clean_model="gpt-4"):
         self.model=model
         self.clean_model=clean_model
 
-    def speech_to_text(self, file_path: str):
-        audio_file = open(file_path, "rb")
-        transcription = client.audio.transcriptions.create(
-            model=self.model, 
-            file=audio_file, 
-            response_format="text"
-        )
+    async def speech_to_text(self, file_path: str):
+        """Transcribe a recording of any length, returned as one string"""
+        segments, _ = await self.transcribe_segments(file_path, preprocess=AUDIO_PREPROCESS)
+        return " ".join(segment["text"] for segment in segments)
+
+    async def transcribe_segments(self, file_path: str, preprocess: bool = False) -> Tuple[List[Dict], Dict]:
+        """
+        Split a recording on silence and transcribe the segments concurrently.
+
+        With preprocess the recording is first downmixed, resampled and trimmed
+        of silence by preprocess_audio; timestamps still refer to the original.
+
+        Returns dicts with start, end (seconds from the start of the recording)
+        and text, in recording order, plus the preprocessing savings (empty
+        when not preprocessed).
+        """
+        semaphore = asyncio.Semaphore(AUDIO_SEGMENT_CONCURRENCY)
+
+        async def transcribe(segment):
+            async with semaphore:
+                text = await self._transcribe_file(segment["path"])
+            return {"start": segment["start"], "end": segment["end"], "text": text.strip()}
+
+        def prepare(out_dir: str):
+            # Decode once; preprocessing and splitting share the decoded audio
+            audio = AudioSegment.from_file(file_path)
+            if not preprocess:
+                return split_audio(audio, out_dir, file_path), None
+            prepared = preprocess_audio(audio, file_path, out_dir)
+            return split_audio(prepared.pop("audio"), out_dir, prepared.pop("path")), prepared
+
+        with tempfile.TemporaryDirectory(prefix="audio_segments_") as out_dir:
+            segments, prepared = await run_blocking(prepare, out_dir)
+            segments = list(await asyncio.gather(*(transcribe(segment) for segment in segments)))
+
+        if prepared is None:
+            return segments, {}
+        regions = prepared.pop("regions")
+        for segment in segments:
+            segment["start"] = to_original_time(segment["start"], regions)
+            segment["end"] = to_original_time(segment["end"], regions)
+        return segments, prepared
+
+    async def _transcribe_file(self, file_path: str) -> str:
+        with open(file_path, "rb") as audio_file:
+            transcription = await get_async_openai().audio.transcriptions.create(
+                model=self.model,
+                file=audio_file,
+                response_format="text"
+            )
         return transcription
 
-    def clean_audio(self, text:str):
-        response = client.chat.completions.create(
+    async def clean_audio(self, text:str):
+        response = await get_async_openai().chat.completions.create(
         model=self.clean_model,
         messages=[
             {"role": "system", "content": "You are a helpful assistant in the construction setting. Please look at this transcription that was said by a worker and strip out\
@@ -30,5 +213,18 @@ class Audio:
             {"role": "user", "content": text}
         ]
     )
-    
+
         return response.choices[0].message.content
+
+    async def clean_segments(self, segments: List[Dict]) -> List[Dict]:
+        """Clean each transcribed segment concurrently, keeping its timestamps"""
+        semaphore = asyncio.Semaphore(AUDIO_SEGMENT_CONCURRENCY)
+
+        async def clean(segment):
+            if not segment["text"]:
+                return segment
+            async with semaphore:
+                text = await self.clean_audio(segment["text"])
+            return {**segment, "text": text}
+
+        return list(await asyncio.gather(*(clean(segment) for segment in segments)))
@@ -0,0 +1,237 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .quantized_vectors import QuantizedVectors
+
+CASE_INDEX_ENABLED = os.getenv("CASE_INDEX_ENABLED", "true").lower() == "true"
+# Residency limits: cases kept loaded, and the total size of their vectors, texts and metadata
+CASE_INDEX_MAX_CASES = int(os.getenv("CASE_INDEX_MAX_CASES", 32))
+CASE_INDEX_MAX_BYTES = int(os.getenv("CASE_INDEX_MAX_MB", 512)) * 1024 * 1024
+# Cases with more chunks than this are left to the vector store's ANN index
+CASE_INDEX_MAX_RECORDS = int(os.getenv("CASE_INDEX_MAX_RECORDS", 20000))
+# "float32"; "float16" to halve memory at a small cost in precision; or "int8" to keep
+# quantized codes in memory and re-score the best candidates from a memory-mapped file
+# (this shrinks only the cache; VECTOR_STORE=quantized compacts the stored vectors)
+CASE_INDEX_DTYPE = os.getenv("CASE_INDEX_DTYPE", "float32")
+
+
+def records_nbytes(ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+    """Approximate memory held by the Python objects of the records"""
+    total = sys.getsizeof(ids) + sys.getsizeof(documents) + sys.getsizeof(metadatas)
+    for record_id, document, metadata in zip(ids, documents, metadatas):
+        total += sys.getsizeof(record_id) + sys.getsizeof(document) + sys.getsizeof(metadata)
+        total += sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in metadata.items())
+    return total
+
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> Optional[bool]:
+    """
+    Whether a record's metadata satisfies a Chroma where filter.
+
+    Only equality conditions, alone or combined with $and, are understood;
+    None is returned for any other filter so the caller can fall back.
+    """
+    if not where:
+        return True
+    if "$and" in where:
+        results = [matches_where(metadata, condition) for condition in where["$and"]]
+        return None if None in results else all(results)
+    if len(where) != 1:
+        return None
+    field, value = next(iter(where.items()))
+    if isinstance(value, dict):
+        if set(value) != {"$eq"}:
+            return None
+        value = value["$eq"]
+    return metadata.get(field) == value
+
+
+class CaseIndex:
+    """Embeddings of one case in a contiguous matrix, searched exactly by brute force"""
+
+    def __init__(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]], dtype: str = CASE_INDEX_DTYPE):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = [metadata or {} for metadata in metadatas]
+        # The texts and metadata are kept for results and filtering, so they count against the budget
+        self.records_nbytes = records_nbytes(self.ids, self.documents, self.metadatas)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        if dtype == "int8":
+            self.quantized = QuantizedVectors(embeddings)
+            return
+        self.quantized = None
+        self.matrix = np.ascontiguousarray(embeddings, dtype=dtype)
+        # Squared norms for the expansion |q - x|^2 = |q|^2 - 2 q.x + |x|^2, kept in float32
+        self.norms = np.einsum("ij,ij->i", self.matrix, self.matrix, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        if self.quantized is not None:
+            return self.records_nbytes + self.quantized.nbytes
+        return self.records_nbytes + self.matrix.nbytes + self.norms.nbytes
+
+    def _dot(self, query: np.ndarray) -> np.ndarray:
+        """Inner product of the query with every row, as one matrix-vector product"""
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ query
+        # NumPy has no fast float16 product, so upcast a block of rows at a time instead
+        return np.concatenate([
+            self.matrix[start:start + 1024].astype(np.float32) @ query
+            for start in range(0, len(self.matrix), 1024)
+        ])
+
+    def query(self, query_embedding: List[float], n_results: int, where: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, List[List[Any]]]]:
+        """
+        The n_results nearest records by squared L2 distance, Chroma's default
+        metric, in Chroma's query result shape; None if the filter is not supported.
+        """
+        candidates = None
+        if where:
+            mask = [matches_where(metadata, where) for metadata in self.metadatas]
+            if None in mask:
+                return None
+            candidates = np.flatnonzero(mask)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self.quantized is not None:
+            rows, distances = self.quantized.search(query, n_results, candidates)
+        else:
+            rows, distances = self._search(query, n_results, candidates)
+        return {
+            "ids": [[self.ids[i] for i in rows]],
+            "documents": [[self.documents[i] for i in rows]],
+            "metadatas": [[self.metadatas[i] for i in rows]],
+            "distances": [distances.tolist()]
+        }
+
+    def _search(self, query: np.ndarray, k: int, candidates: Optional[np.ndarray]):
+        distances = self.norms - 2 * self._dot(query) + query @ query
+        if candidates is not None:
+            distances = distances[candidates]
+        else:
+            candidates = np.arange(len(self.ids))
+
+        k = min(k, len(candidates))
+        if k == 0:
+            return candidates[:0], np.zeros(0, dtype=np.float32)
+        top = np.argpartition(distances, k - 1)[:k] if k < len(candidates) else np.arange(k)
+        top = top[np.argsort(distances[top])]
+        return candidates[top], np.maximum(distances[top], 0)
+
+
+class CaseIndexCache:
+    """
+    LRU cache of per-case in-memory indexes for exact case-scoped search.
+
+    A case's embeddings are loaded from the vector store on its first
+    search and kept until the case is written, or until the cache holds more
+    than max_cases cases or max_bytes. Each invalidation bumps the case's
+    generation, so an index loaded while a write was in flight is never
+    cached. Cases that cannot be held (empty, over max_records, or over
+    max_bytes on their own) are remembered until they are next written, so
+    their searches go straight to the vector store without loading them.
+    """
+
+    def __init__(
+        self,
+        max_cases: int = CASE_INDEX_MAX_CASES,
+        max_bytes: int = CASE_INDEX_MAX_BYTES,
+        max_records: int = CASE_INDEX_MAX_RECORDS,
+        dtype: str = CASE_INDEX_DTYPE
+    ):
+        self.max_cases = max_cases
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.dtype = dtype
+        self._indexes: "OrderedDict[str, CaseIndex]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        # Cases that cannot be held, with the generation they were checked at
+        self._unindexable: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self._epoch = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "unindexable": 0, "evictions": 0}
+
+    def _generation(self, case_id: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(case_id, 0)
+
+    def get(self, case_id: str, load: Callable[[], Dict[str, Any]], size: Optional[Callable[[], int]] = None) -> Optional[CaseIndex]:
+        """
+        The index for a case, loading it with load() (a vector store get
+        result with embeddings, documents and metadatas) on a miss. size(),
+        if given, counts the case's records so that a case over max_records
+        is never loaded. None if the case is empty or cannot be held.
+        """
+        with self._lock:
+            index = self._indexes.get(case_id)
+            if index is not None:
+                self._indexes.move_to_end(case_id)
+                self.counters["hits"] += 1
+                return index
+            generation = self._generation(case_id)
+            if self._unindexable.get(case_id) == generation:
+                self.counters["unindexable"] += 1
+                return None
+            self.counters["misses"] += 1
+
+        if size is not None and size() > self.max_records:
+            self._mark_unindexable(case_id, generation)
+            return None
+        records = load()
+        if not len(records['ids']) or len(records['ids']) > self.max_records:
+            self._mark_unindexable(case_id, generation)
+            return None
+        index = CaseIndex(records['ids'], records['embeddings'], records['documents'], records['metadatas'], dtype=self.dtype)
+        if index.nbytes > self.max_bytes:
+            # Answer this search from it, but it could never stay resident
+            self._mark_unindexable(case_id, generation)
+            return index
+
+        with self._lock:
+            if generation == self._generation(case_id) and case_id not in self._indexes:
+                self._indexes[case_id] = index
+                self._bytes += index.nbytes
+                self._evict()
+        return index
+
+    def _mark_unindexable(self, case_id: str, generation: Tuple[int, int]) -> None:
+        with self._lock:
+            if generation != self._generation(case_id):
+                return
+            self._unindexable[case_id] = generation
+            self._unindexable.move_to_end(case_id)
+            # Only recent cases need remembering; entries from older generations are dead anyway
+            while len(self._unindexable) > 1024:
+                self._unindexable.popitem(last=False)
+
+    def _evict(self) -> None:
+        while self._indexes and (len(self._indexes) > self.max_cases or self._bytes > self.max_bytes):
+            _, index = self._indexes.popitem(last=False)
+            self._bytes -= index.nbytes
+            self.counters["evictions"] += 1
+
+    def invalidate(self, case_id: str) -> None:
+        with self._lock:
+            self._generations[case_id] = self._generations.get(case_id, 0) + 1
+            self._unindexable.pop(case_id, None)
+            index = self._indexes.pop(case_id, None)
+            if index is not None:
+                self._bytes -= index.nbytes
+
+    def clear(self) -> None:
+        """Drop every index, for writes whose cases are not known"""
+        with self._lock:
+            self._epoch += 1
+            self._indexes.clear()
+            self._unindexable.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            stats = dict(self.counters, cases=len(self._indexes), bytes=self._bytes)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else None
+        return stats
@@ -1,34 +1,545 @@
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 import chromadb
 from dotenv import load_dotenv
 
 load_dotenv()
 
 CHROMA_KEY = os.getenv("CHROMA_API_KEY")
-class VectorDB:
-    def __init__(self):
-        self.client = chromadb.HttpClient(
+# Where vectors live: "cloud" (hosted Chroma), "http" (a Chroma server of our own),
+# "persistent" (embedded, on local disk) or "memory" (embedded, lost on exit)
+CHROMA_MODE = os.getenv("CHROMA_MODE", "cloud")
+CHROMA_TENANT = os.getenv("CHROMA_TENANT", "5f4e69d6-09e0-4a7f-891f-0252553b86d4")
+CHROMA_DATABASE = os.getenv("CHROMA_DATABASE", "Rag")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
+CHROMA_SSL = os.getenv("CHROMA_SSL", "false").lower() == "true"
+CHROMA_PATH = os.getenv("CHROMA_PATH", "uploads/chroma")
+# "none" keeps every case in one collection; "case" gives each case its own collection;
+# "bucket" spreads cases over CHROMA_SHARD_BUCKETS collections by a hash of the case ID
+CHROMA_SHARDING = os.getenv("CHROMA_SHARDING", "none")
+CHROMA_SHARD_BUCKETS = int(os.getenv("CHROMA_SHARD_BUCKETS", 16))
+# Shards searched at once when a search spans every case
+CHROMA_FANOUT_WORKERS = int(os.getenv("CHROMA_FANOUT_WORKERS", 8))
+
+# Per-record arguments of Chroma's write methods, split alongside the IDs when records go to different shards
+RECORD_FIELDS = ("ids", "documents", "metadatas", "embeddings", "uris", "images")
+# Upper bound on records per add call, further capped by what the server reports
+CHROMA_MAX_BATCH_SIZE = int(os.getenv("CHROMA_MAX_BATCH_SIZE", 1000))
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "Rag")
+# Model the collection was filled with before collections recorded their model
+LEGACY_EMBEDDING_MODEL = ("text-embedding-3-small", 1536)
+
+def build_where(case_id: Optional[str] = None, doc_type: Optional[str] = None, original_filename: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Metadata filter for the given fields, or None when no field is set"""
+    conditions = [
+        {field: value}
+        for field, value in (("case_id", case_id), ("doc_type", doc_type), ("original_filename", original_filename))
+        if value
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def create_chroma_client(mode: str = CHROMA_MODE):
+    """Chroma client for the configured deployment mode"""
+    if mode == "cloud":
+        return chromadb.HttpClient(
             ssl=True,
             host='api.trychroma.com',
-            tenant='5f4e69d6-09e0-4a7f-891f-0252553b86d4',
-            database='Rag',
+            tenant=CHROMA_TENANT,
+            database=CHROMA_DATABASE,
             headers={
                 'x-chroma-token': CHROMA_KEY
             }
         )
-        self.collection = self.client.get_or_create_collection(name="Rag")
+    if mode == "http":
+        headers = {'x-chroma-token': CHROMA_KEY} if CHROMA_KEY else None
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT, ssl=CHROMA_SSL, headers=headers)
+    if mode == "persistent":
+        return chromadb.PersistentClient(path=CHROMA_PATH)
+    if mode == "memory":
+        return chromadb.EphemeralClient()
+    raise ValueError(f"Unknown CHROMA_MODE {mode!r}; expected 'cloud', 'http', 'persistent' or 'memory'")
+
+def case_id_from_where(where: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The case a metadata filter is restricted to, if it pins exactly one"""
+    if not where:
+        return None
+    if isinstance(where.get("case_id"), str):
+        return where["case_id"]
+    for condition in where.get("$and", []):
+        case_id = case_id_from_where(condition)
+        if case_id:
+            return case_id
+    return None
+
+def merge_query_results(results: List[Dict[str, Any]], n_results: int) -> Dict[str, Any]:
+    """Merge per-shard query results (one query each) into the n_results nearest overall"""
+    if not results:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    keys = [key for key in ("ids", "documents", "metadatas", "distances", "embeddings") if results[0].get(key) is not None]
+    rows = []
+    for result in results:
+        columns = [list(result[key][0]) for key in keys]
+        rows.extend(zip(*columns))
+    distance_index = keys.index("distances")
+    rows.sort(key=lambda row: row[distance_index])
+    rows = rows[:n_results]
+    return {key: [[row[i] for row in rows]] for i, key in enumerate(keys)}
+
+def merge_get_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Concatenate per-shard get results"""
+    if not results:
+        return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    merged = {"ids": []}
+    for key in ("documents", "metadatas", "embeddings"):
+        if results[0].get(key) is not None:
+            merged[key] = []
+    for result in results:
+        for key in merged:
+            merged[key].extend(list(result[key]))
+    return merged
+
+class VectorDB:
+    def __init__(self, keyword_index=None, embedding_model: Optional[str] = None, dimension: Optional[int] = None,
+                 collection_name: str = CHROMA_COLLECTION, client=None, sharding: str = CHROMA_SHARDING, case_index=None,
+                 vector_store=None):
+        # All vector reads and writes go through this class, whichever client backs it
+        self.client = client or create_chroma_client()
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.dimension = dimension
+        self.sharding = sharding
+        # Unsharded mode, and records without a case ID in sharded modes, use the base collection
+        self.collection = self._open_collection(collection_name)
+        self._shards: Dict[str, Any] = {}
+        self._shards_lock = threading.Lock()
+        # Until reshard() has emptied the base collection of case records, case reads check it too
+        self._resharded = sharding == "none" or (self.collection.metadata or {}).get("resharded") == sharding
+        self._fanout = ThreadPoolExecutor(max_workers=CHROMA_FANOUT_WORKERS, thread_name_prefix="chroma-fanout")
+        self._max_batch_size = None
+        # Bumped on every write so cached query results from before it are never served
+        self.version = 0
+        self._version_lock = threading.Lock()
+        # Optional BM25 index kept in step with every write below
+        self.keyword_index = keyword_index
+        # Optional in-memory per-case indexes, invalidated by every write below
+        self.case_index = case_index
+        # Optional QuantizedVectorStore holding the embeddings, leaving Chroma with texts and metadata
+        self.vector_store = vector_store
+    
+    def _open_collection(self, name: str):
+        collection = self.client.get_or_create_collection(name=name)
+        if self.embedding_model:
+            self._check_embedding_model(collection, self.embedding_model, self.dimension)
+        return collection
+    
+    def _check_embedding_model(self, collection, embedding_model: str, dimension: Optional[int]) -> None:
+        """
+        Record the embedding model and dimension on the collection, or refuse
+        to use a collection filled by a different model.
+        """
+        metadata = dict(collection.metadata or {})
+        recorded = (metadata.get("embedding_model"), metadata.get("embedding_dimension"))
+        if recorded[0] is None:
+            # An unrecorded collection that already holds vectors predates this check
+            recorded = LEGACY_EMBEDDING_MODEL if collection.count() else (embedding_model, dimension)
+            collection.modify(metadata={**metadata, "embedding_model": recorded[0], "embedding_dimension": recorded[1]})
+        
+        if recorded != (embedding_model, dimension):
+            raise ValueError(
+                f"Collection {collection.name!r} holds {recorded[0]} embeddings ({recorded[1]} dimensions), "
+                f"but the configured backend produces {embedding_model} ({dimension} dimensions). "
+                f"Set CHROMA_COLLECTION to a collection for this model."
+            )
+    
+    # --- Sharding -------------------------------------------------------------
+    
+    def shard_name(self, case_id: Optional[str]) -> str:
+        """Name of the collection holding a case's records"""
+        if self.sharding == "none" or not case_id:
+            return self.collection_name
+        if self.sharding == "case":
+            return f"{self.collection_name}_case_{case_id}"
+        if self.sharding == "bucket":
+            bucket = int(hashlib.sha1(case_id.encode("utf-8")).hexdigest(), 16) % CHROMA_SHARD_BUCKETS
+            return f"{self.collection_name}_bucket_{bucket:03d}"
+        raise ValueError(f"Unknown CHROMA_SHARDING {self.sharding!r}; expected 'none', 'case' or 'bucket'")
+    
+    def _shard(self, case_id: Optional[str], create: bool = False):
+        """The collection holding a case; None if it does not exist and create is False"""
+        name = self.shard_name(case_id)
+        if name == self.collection_name:
+            return self.collection
+        with self._shards_lock:
+            if name not in self._shards:
+                if create:
+                    self._shards[name] = self._open_collection(name)
+                else:
+                    try:
+                        self._shards[name] = self.client.get_collection(name=name)
+                    except Exception:
+                        # Nothing has been stored for this case (or bucket) yet
+                        return None
+            return self._shards[name]
+    
+    def _all_collections(self) -> List[Any]:
+        """The base collection and every shard, including shards created by other processes"""
+        if self.sharding == "none":
+            return [self.collection]
+        prefix = f"{self.collection_name}_{self.sharding}_"
+        names = [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+        with self._shards_lock:
+            for name in names:
+                if name.startswith(prefix) and name not in self._shards:
+                    self._shards[name] = self.client.get_collection(name=name)
+            return [self.collection, *self._shards.values()]
+    
+    def _collections_for(self, case_id: Optional[str]) -> List[Any]:
+        """Collections to read for a case, or all of them without one; an unknown case has none"""
+        if not case_id or self.sharding == "none":
+            return self._all_collections()
+        shard = self._shard(case_id)
+        collections = [shard] if shard is not None else []
+        if not self._resharded:
+            # Records stored before sharding was enabled may not have been moved by reshard() yet
+            collections.append(self.collection)
+        return collections
+    
+    def _fan_out(self, collections: List[Any], method: str, **kwargs) -> List[Any]:
+        if len(collections) == 1:
+            return [getattr(collections[0], method)(**kwargs)]
+        return list(self._fanout.map(lambda collection: getattr(collection, method)(**kwargs), collections))
+    
+    def _group_by_shard(self, kwargs: Dict[str, Any]) -> List[tuple]:
+        """Split the records of an add/upsert call into one call per shard"""
+        if self.sharding == "none":
+            return [(self.collection, kwargs)]
+        metadatas = kwargs.get('metadatas') or [{} for _ in kwargs['ids']]
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(self.shard_name(metadata.get('case_id')), []).append(i)
+        
+        calls = []
+        for indices in groups.values():
+            case_id = metadatas[indices[0]].get('case_id')
+            part = {
+                key: [value[i] for i in indices] if key in RECORD_FIELDS and value is not None else value
+                for key, value in kwargs.items()
+            }
+            calls.append((self._shard(case_id, create=True), part))
+        return calls
+    
+    # --- Reads and writes -----------------------------------------------------
+    
+    def _bump_version(self, case_ids: Optional[set] = None) -> None:
+        """Record a write to the given cases, or to unknown cases if None"""
+        with self._version_lock:
+            self.version += 1
+        if self.case_index:
+            if case_ids is None:
+                self.case_index.clear()
+            for case_id in case_ids or ():
+                self.case_index.invalidate(case_id)
+    
+    @staticmethod
+    def _written_cases(metadatas: Optional[List[Dict[str, Any]]]) -> Optional[set]:
+        return {metadata.get('case_id') for metadata in metadatas} - {None} if metadatas is not None else None
+    
+    def _split_vectors(self, kwargs: Dict[str, Any], placeholder: bool = True) -> tuple:
+        """
+        Take the embeddings of a write call out for the vector store, if there
+        is one. Returns the call for Chroma, with a one-dimensional placeholder
+        per record instead (or none at all, for updates), and the embeddings.
+        They are written only once Chroma has the records, since orphaned
+        vectors could never be found again to delete.
+        """
+        if not self.vector_store or kwargs.get('embeddings') is None:
+            return kwargs, None
+        kwargs = dict(kwargs)
+        embeddings = kwargs.pop('embeddings')
+        if placeholder:
+            kwargs['embeddings'] = [[0.0] for _ in kwargs['ids']]
+        return kwargs, embeddings
+    
+    def add(self, **kwargs) -> None:
+        try:
+            kwargs, embeddings = self._split_vectors(kwargs)
+            for collection, part in self._group_by_shard(kwargs):
+                collection.add(**part)
+            if embeddings is not None:
+                self.vector_store.upsert(kwargs['ids'], embeddings)
+            if self.keyword_index:
+                self.keyword_index.upsert(kwargs['ids'], kwargs.get('documents'), kwargs.get('metadatas'))
+        finally:
+            # A failed call may still have written part of its records
+            self._bump_version(self._written_cases(kwargs.get('metadatas')))
+    
+    def upsert(self, **kwargs) -> None:
+        try:
+            kwargs, embeddings = self._split_vectors(kwargs)
+            for collection, part in self._group_by_shard(kwargs):
+                collection.upsert(**part)
+            if embeddings is not None:
+                self.vector_store.upsert(kwargs['ids'], embeddings)
+            if self.keyword_index:
+                self.keyword_index.upsert(kwargs['ids'], kwargs.get('documents'), kwargs.get('metadatas'))
+        finally:
+            self._bump_version(self._written_cases(kwargs.get('metadatas')))
+    
+    def update(self, case_id: Optional[str] = None, **kwargs) -> None:
+        """Update records by ID; pass case_id when sharded to avoid looking the records up in every shard"""
+        try:
+            kwargs, embeddings = self._split_vectors(kwargs, placeholder=False)
+            collections = self._collections_for(case_id)
+            if set(kwargs) == {'ids'}:
+                # Only the vectors change, and Chroma holds none of them
+                pass
+            elif len(collections) == 1:
+                collections[0].update(**kwargs)
+            else:
+                # Update each record in the shard that holds it
+                positions = {record_id: i for i, record_id in enumerate(kwargs['ids'])}
+                found = self._fan_out(collections, "get", ids=kwargs['ids'], include=[])
+                for collection, result in zip(collections, found):
+                    if result['ids']:
+                        indices = [positions[record_id] for record_id in result['ids']]
+                        collection.update(**{
+                            key: [value[i] for i in indices] if key in RECORD_FIELDS and value is not None else value
+                            for key, value in kwargs.items()
+                        })
+            if embeddings is not None:
+                self.vector_store.upsert(kwargs['ids'], embeddings)
+            if self.keyword_index:
+                self.keyword_index.update(kwargs['ids'], kwargs.get('documents'), kwargs.get('metadatas'))
+        finally:
+            self._bump_version({case_id} if case_id else None)
+    
+    def delete(self, case_id: Optional[str] = None, **kwargs) -> None:
+        case_id = case_id or case_id_from_where(kwargs.get('where'))
+        try:
+            collections = self._collections_for(case_id)
+            ids = kwargs.get('ids')
+            if (self.keyword_index or self.vector_store) and ids is None:
+                # Resolve a where filter to IDs so the keyword index and vector store drop the same records
+                found = self._fan_out(collections, "get", where=kwargs.get('where'), where_document=kwargs.get('where_document'), include=[])
+                ids = [record_id for result in found for record_id in result['ids']]
+            
+            if self.sharding == "case" and case_id and kwargs.get('where') == {"case_id": case_id}:
+                # The case owns its shard, so dropping the collection removes exactly its records
+                name = self.shard_name(case_id)
+                with self._shards_lock:
+                    self._shards.pop(name, None)
+                if any(collection.name == name for collection in collections):
+                    self.client.delete_collection(name=name)
+                if not self._resharded:
+                    self.collection.delete(**kwargs)
+            else:
+                self._fan_out(collections, "delete", **kwargs)
+            
+            if self.keyword_index:
+                self.keyword_index.delete(ids)
+            if self.vector_store:
+                self.vector_store.delete(ids)
+        finally:
+            self._bump_version({case_id} if case_id else None)
+    
+    def reshard(self, page_size: int = 1000) -> int:
+        """
+        Move records with a case ID out of the base collection into their
+        shards, e.g. after enabling sharding over an existing collection.
+        Returns the number of records moved. Once every record is moved the
+        base collection is marked, so case reads stop checking it.
+        """
+        if self._resharded:
+            return 0
+        moved = 0
+        offset = 0
+        try:
+            while True:
+                page = self.collection.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+                if not len(page['ids']):
+                    break
+                indices = [i for i, metadata in enumerate(page['metadatas']) if (metadata or {}).get('case_id')]
+                # Records without a case stay, so the next page starts after them
+                offset += len(page['ids']) - len(indices)
+                if not indices:
+                    continue
+                records = {key: [page[key][i] for i in indices] for key in ("ids", "documents", "metadatas", "embeddings")}
+                for collection, part in self._group_by_shard(records):
+                    collection.upsert(**part)
+                self.collection.delete(ids=records['ids'])
+                moved += len(indices)
+            metadata = dict(self.collection.metadata or {})
+            self.collection.modify(metadata={**metadata, "resharded": self.sharding})
+            self._resharded = True
+        finally:
+            if moved:
+                self._bump_version()
+        return moved
+    
+    def migrate_to_vector_store(self, source_name: str = CHROMA_COLLECTION, page_size: int = 1000) -> int:
+        """
+        Copy the records of a full-vector collection, and its shards, into
+        this collection and the vector store, e.g. on the first start with
+        VECTOR_STORE=quantized. The source is left as it was. This
+        collection is marked once the copy completes, so an interrupted copy
+        is redone on the next start. Returns the number of records copied.
+        """
+        if not self.vector_store or source_name == self.collection_name:
+            return 0
+        metadata = dict(self.collection.metadata or {})
+        if metadata.get("migrated_from") == source_name:
+            return 0
+        
+        prefixes = (f"{source_name}_case_", f"{source_name}_bucket_")
+        names = [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+        sources = [self.client.get_collection(name=name) for name in names if name == source_name or name.startswith(prefixes)]
+        copied = 0
+        for source in sources:
+            if self.embedding_model:
+                # Vectors from another model could never be searched with this one's queries
+                self._check_embedding_model(source, self.embedding_model, self.dimension)
+            offset = 0
+            while True:
+                page = source.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+                if not len(page['ids']):
+                    break
+                self.upsert(
+                    ids=page['ids'],
+                    documents=page['documents'],
+                    metadatas=[record_metadata or {} for record_metadata in page['metadatas']],
+                    embeddings=page['embeddings']
+                )
+                offset += len(page['ids'])
+            copied += offset
+        
+        self.collection.modify(metadata={**metadata, "migrated_from": source_name})
+        return copied
+    
+    def ensure_keyword_index(self) -> int:
+        """
+        Index the records stored before the keyword index existed, e.g. on the
+        first start after enabling it. The index is marked once this completes,
+        so an interrupted backfill is finished on the next start. Returns the
+        records indexed.
+        """
+        if not self.keyword_index or self.keyword_index.backfilled():
+            return 0
+        indexed = self.rebuild_keyword_index()
+        self.keyword_index.mark_backfilled()
+        if indexed:
+            print(f"Indexed {indexed} existing records for keyword search")
+        return indexed
+    
+    def rebuild_keyword_index(self, page_size: int = 1000) -> int:
+        """Index every record already in the collection, e.g. after enabling the keyword index"""
+        indexed = 0
+        for collection in self._all_collections():
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                if not page['ids']:
+                    break
+                self.keyword_index.upsert(page['ids'], page['documents'], page['metadatas'])
+                offset += len(page['ids'])
+            indexed += offset
+        return indexed
+    
+    def get(self, case_id: Optional[str] = None, **kwargs):
+        """Get records; a case_id argument or case_id filter reads only that case's shard"""
+        include = kwargs.get('include')
+        if self.vector_store and include and "embeddings" in include:
+            # Chroma holds placeholders only; the embeddings come from the vector store
+            result = self.get(case_id=case_id, **{**kwargs, 'include': [field for field in include if field != "embeddings"]})
+            embeddings = self.vector_store.get(result['ids'])
+            # Records whose vectors were never written have none to return, so they are left out
+            keep = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+            if len(keep) < len(embeddings):
+                for key in RECORD_FIELDS:
+                    if result.get(key) is not None:
+                        result[key] = [result[key][i] for i in keep]
+            result['embeddings'] = [embeddings[i] for i in keep]
+            return result
+        collections = self._collections_for(case_id or case_id_from_where(kwargs.get('where')))
+        if len(collections) == 1:
+            return collections[0].get(**kwargs)
+        return merge_get_results(self._fan_out(collections, "get", **kwargs))
+    
+    def query(self, case_id: Optional[str] = None, **kwargs):
+        """
+        Nearest-neighbour search. Searches within one case are answered
+        exactly from the in-memory case index when it is enabled; searches
+        spanning every case fan out over the shards in parallel.
+        """
+        case_id = case_id or case_id_from_where(kwargs.get('where'))
+        if self.case_index and case_id and set(kwargs) <= {"query_embeddings", "n_results", "where"} and len(kwargs.get("query_embeddings") or ()) == 1:
+            index = self.case_index.get(
+                case_id,
+                load=lambda: self.get(case_id=case_id, where={"case_id": case_id}, include=["embeddings", "documents", "metadatas"]),
+                size=lambda: len(self.get(case_id=case_id, where={"case_id": case_id}, include=[])['ids'])
+            )
+            results = index.query(kwargs["query_embeddings"][0], kwargs.get("n_results", 10), kwargs.get("where")) if index else None
+            if results is not None:
+                return results
+        
+        if self.vector_store:
+            return self._query_vector_store(case_id, **kwargs)
+        
+        collections = self._collections_for(case_id)
+        if len(collections) == 1:
+            return collections[0].query(**kwargs)
+        return merge_query_results(self._fan_out(collections, "query", **kwargs), kwargs.get('n_results', 10))
+    
+    def _query_vector_store(self, case_id: Optional[str], query_embeddings: List[List[float]], n_results: int = 10,
+                            where: Optional[Dict[str, Any]] = None, where_document: Optional[Dict[str, Any]] = None,
+                            include: Optional[List[str]] = None):
+        """
+        Nearest-neighbour search against the vector store, in Chroma's query
+        result shape. Filters are resolved to candidate IDs through Chroma first.
+        """
+        where = where or ({"case_id": case_id} if case_id else None)
+        candidates = None
+        if where or where_document:
+            candidates = self.get(case_id=case_id, where=where, where_document=where_document, include=[])['ids']
+        
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_embedding in query_embeddings:
+            ids, distances = self.vector_store.search(query_embedding, n_results, candidates)
+            records = self.get(case_id=case_id, ids=ids, include=["documents", "metadatas"]) if ids else {"ids": []}
+            found = {record_id: i for i, record_id in enumerate(records['ids'])}
+            # A record deleted from Chroma between the two reads is left out
+            hits = [(record_id, distance) for record_id, distance in zip(ids, distances) if record_id in found]
+            results["ids"].append([record_id for record_id, _ in hits])
+            results["documents"].append([records['documents'][found[record_id]] for record_id, _ in hits])
+            results["metadatas"].append([records['metadatas'][found[record_id]] for record_id, _ in hits])
+            results["distances"].append([distance for _, distance in hits])
+        return results
+    
+    def max_batch_size(self) -> int:
+        """Largest number of records to send to Chroma in a single add call"""
+        if self._max_batch_size is None:
+            try:
+                self._max_batch_size = min(CHROMA_MAX_BATCH_SIZE, self.client.get_max_batch_size())
+            except Exception:
+                self._max_batch_size = CHROMA_MAX_BATCH_SIZE
+        return self._max_batch_size
     
     def delete_case_from_chromadb(self, case_id: str) -> bool:
         """Delete all documents associated with a case from ChromaDB"""
         try:
             # Get all documents for this case
-            results = self.collection.get(
+            results = self.get(
                 where={"case_id": case_id}
             )
             
             if results['ids']:
                 # Delete all documents with this case_id
-                self.collection.delete(
+                self.delete(
                     where={"case_id": case_id}
                 )
                 print(f"Deleted {len(results['ids'])} documents from ChromaDB for case {case_id}")
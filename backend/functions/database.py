@@ -1,77 +1,136 @@
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from typing import Any, Dict, List, Optional
 from pathlib import Path
-
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+from .executor import run_blocking
+from .services import get_supabase
 
 async def create_case_in_supabase(case_id: str) -> dict:
     """Create a new case record in Supabase"""
+    supabase = get_supabase()
     case_data = {"id": case_id}
-    result = supabase.table('cases').insert(case_data).execute()
+    result = await run_blocking(supabase.table('cases').insert(case_data).execute)
     return result.data[0]
 
-async def upload_file_to_supabase(
-    file_path: str, 
-    case_id: str, 
+MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.wav': 'audio/wav',
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png'
+}
+
+def content_storage_path(content_hash: str, original_filename: str) -> str:
+    """Content-addressed storage path shared by every upload of the same bytes"""
+    return f"content/{content_hash}{Path(original_filename).suffix.lower()}"
+
+async def upload_to_storage(file_path: str, storage_path: str, mime_type: str, shared: bool = False) -> None:
+    """Stream a file into the storage bucket; shared content may already have been stored by another upload"""
+    # Hand the open file to the client so the request body is streamed from disk
+    with open(file_path, 'rb') as f:
+        try:
+            storage_response = await run_blocking(
+                get_supabase().storage.from_('construction_files').upload,
+                path=storage_path,
+                file=f,
+                file_options={"content-type": mime_type}
+            )
+        except Exception as e:
+            # Another upload of the same content got there first
+            if not (shared and "Duplicate" in str(e)):
+                raise
+            storage_response = None
+        
+        # Check if upload was successful
+        if hasattr(storage_response, 'error') and storage_response.error:
+            raise Exception(f"Failed to upload file to Supabase: {storage_response.error}")
+
+async def ensure_content_stored(file_path: str, file_record: Dict[str, Any]) -> None:
+    """
+    Upload a content-addressed file again if its object is gone.
+    
+    An upload that found the content already stored does not write it, but a
+    case deletion may have removed the object after seeing no other files
+    row referencing it. Call this once the upload's own row is inserted: from
+    then on deletions see the reference and keep the object.
+    """
+    storage_path = file_record['storage_path']
+    if not storage_path.startswith("content/"):
+        return
+    folder, name = storage_path.rsplit("/", 1)
+    listing = await run_blocking(get_supabase().storage.from_('construction_files').list, folder, {"search": name})
+    if any(entry.get('name') == name for entry in listing or []):
+        return
+    await upload_to_storage(file_path, storage_path, file_record['mime_type'], shared=True)
+
+async def store_file_in_supabase(
+    file_path: str,
+    case_id: str,
     file_type: str,
-    original_filename: str
-) -> dict:
-    """Upload file to Supabase storage and save metadata"""
+    original_filename: str,
+    content_hash: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Upload a file to Supabase storage without recording it in the files table.
     
-    # Determine MIME type
-    mime_types = {
-        '.pdf': 'application/pdf',
-        '.wav': 'audio/wav',
-        '.mp3': 'audio/mpeg',
-        '.m4a': 'audio/mp4',
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png'
-    }
+    The file is streamed from disk rather than read into memory. With a
+    content_hash the file is stored at a content-addressed path, so identical
+    bytes uploaded to several cases are stored only once.
+    
+    Returns:
+        The storage details (storage_path, file_url, file_size, mime_type)
+        to pass to save_file_metadata
+    """
+    supabase = get_supabase()
     
     file_ext = Path(original_filename).suffix.lower()
-    mime_type = mime_types.get(file_ext, 'application/octet-stream')
+    mime_type = MIME_TYPES.get(file_ext, 'application/octet-stream')
     
     # Create storage path
-    storage_path = f"cases/{case_id}/{file_type}s/{original_filename}"
+    if content_hash:
+        storage_path = content_storage_path(content_hash, original_filename)
+        existing = await run_blocking(
+            supabase.table('files').select('id').eq('storage_path', storage_path).limit(1).execute
+        )
+        already_stored = bool(existing.data)
+    else:
+        storage_path = f"cases/{case_id}/{file_type}s/{original_filename}"
+        already_stored = False
+    
+    file_size = os.path.getsize(file_path)
     
     # Upload to storage bucket
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
-        file_size = len(file_data)
-        
-        # Upload file
-        storage_response = supabase.storage.from_('construction_files').upload(
-            path=storage_path,
-            file=file_data,
-            file_options={"content-type": mime_type}
-        )
-        
-        # Check if upload was successful
-        if hasattr(storage_response, 'error') and storage_response.error:
-            raise Exception(f"Failed to upload file to Supabase: {storage_response.error}")
+    if not already_stored:
+        await upload_to_storage(file_path, storage_path, mime_type, shared=bool(content_hash))
     
     # Get public URL (if bucket is public)
     file_url = supabase.storage.from_('construction_files').get_public_url(storage_path)
     
-    # Save metadata to database
-    file_metadata = {
-        "case_id": case_id,
-        "file_type": file_type,
-        "original_filename": original_filename,
+    return {
         "storage_path": storage_path,
         "file_url": file_url,
         "file_size": file_size,
         "mime_type": mime_type
     }
+
+async def save_file_metadata(
+    case_id: str,
+    file_type: str,
+    original_filename: str,
+    stored_file: Dict[str, Any],
+    processing_status: str = "completed"
+) -> dict:
+    """Insert the files row for a file uploaded with store_file_in_supabase"""
+    file_metadata = {
+        "case_id": case_id,
+        "file_type": file_type,
+        "original_filename": original_filename,
+        **stored_file,
+        "processing_status": processing_status
+    }
     
-    db_result = supabase.table('files').insert(file_metadata).execute()
+    db_result = await run_blocking(get_supabase().table('files').insert(file_metadata).execute)
     
     # Check database insert was successful
     if not db_result.data:
@@ -79,30 +138,72 @@ async def upload_file_to_supabase(
     
     return db_result.data[0]
 
+async def upload_file_to_supabase(
+    file_path: str, 
+    case_id: str, 
+    file_type: str,
+    original_filename: str,
+    processing_status: str = "completed",
+    content_hash: Optional[str] = None
+) -> dict:
+    """Upload file to Supabase storage and save metadata"""
+    stored_file = await store_file_in_supabase(file_path, case_id, file_type, original_filename, content_hash)
+    return await save_file_metadata(case_id, file_type, original_filename, stored_file, processing_status)
+
+async def find_file_metadata(case_id: str, original_filename: str, content_hash: Optional[str] = None) -> Optional[dict]:
+    """The files row of an upload to a case, if one was recorded"""
+    query = get_supabase().table('files').select('*').eq('case_id', case_id).eq('original_filename', original_filename)
+    if content_hash:
+        query = query.eq('storage_path', content_storage_path(content_hash, original_filename))
+    result = await run_blocking(query.limit(1).execute)
+    return result.data[0] if result.data else None
+
+async def find_processed_content(content_hash: str, original_filename: str, limit: int = 10) -> List[dict]:
+    """Completed files rows (id and case_id) of earlier uploads of the same bytes"""
+    result = await run_blocking(
+        get_supabase().table('files').select('id, case_id')
+        .eq('storage_path', content_storage_path(content_hash, original_filename))
+        .eq('processing_status', 'completed')
+        .limit(limit).execute
+    )
+    return result.data or []
+
+async def update_file_processing_status(file_id: str, processing_status: str) -> None:
+    """Record the processing state (processing/completed/failed) of an uploaded file"""
+    await run_blocking(
+        get_supabase().table('files').update({"processing_status": processing_status}).eq('id', file_id).execute
+    )
+
 async def delete_case_from_supabase(case_id: str) -> bool:
     """Delete a case and all its associated data from Supabase"""
+    supabase = get_supabase()
     try:
         # Get all files associated with this case
-        files_result = supabase.table('files').select('storage_path').eq('case_id', case_id).execute()
-        
-        # Delete files from storage
-        if files_result.data:
-            for file_record in files_result.data:
-                storage_path = file_record['storage_path']
-                try:
-                    supabase.storage.from_('construction_files').remove([storage_path])
-                except Exception as e:
-                    print(f"Warning: Could not delete file {storage_path}: {e}")
+        files_result = await run_blocking(supabase.table('files').select('storage_path').eq('case_id', case_id).execute)
         
         # Delete from database tables in order (respecting foreign key constraints)
         # Delete tasks first
-        supabase.table('tasks').delete().eq('case_id', case_id).execute()
+        await run_blocking(supabase.table('tasks').delete().eq('case_id', case_id).execute)
+        
+        # Delete files metadata before the files, so a reference check below also sees rows inserted meanwhile
+        await run_blocking(supabase.table('files').delete().eq('case_id', case_id).execute)
         
-        # Delete files metadata
-        supabase.table('files').delete().eq('case_id', case_id).execute()
+        # Delete files from storage
+        for storage_path in dict.fromkeys(file_record['storage_path'] for file_record in files_result.data or []):
+            # Content-addressed files may still be referenced by other cases
+            shared = await run_blocking(
+                supabase.table('files').select('id').eq('storage_path', storage_path).limit(1).execute
+            )
+            if shared.data:
+                continue
+            
+            try:
+                await run_blocking(supabase.storage.from_('construction_files').remove, [storage_path])
+            except Exception as e:
+                print(f"Warning: Could not delete file {storage_path}: {e}")
         
         # Delete the case itself
-        result = supabase.table('cases').delete().eq('id', case_id).execute()
+        result = await run_blocking(supabase.table('cases').delete().eq('id', case_id).execute)
         
         return True
         
@@ -0,0 +1,228 @@
+import os
+import time
+from abc import ABC, abstractmethod
+import threading
+from pathlib import Path
+from typing import List, Optional
+from .services import get_openai
+
+# "openai" or "local"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Output sizes of the OpenAI embedding models
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# OpenAI embeddings endpoint limits: inputs per request and total tokens per request
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", 2048))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", 300000))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 3))
+
+# Local CPU backend: the same MiniLM model TextProcessing tokenizes with
+LOCAL_EMBED_MODEL = os.getenv("LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", 32))
+# "torch" runs the transformers model; "onnx" exports it once and runs it with onnxruntime
+LOCAL_EMBED_RUNTIME = os.getenv("LOCAL_EMBED_RUNTIME", "torch")
+# Dynamic int8 quantization of the linear layers, for either runtime
+LOCAL_EMBED_QUANTIZE = os.getenv("LOCAL_EMBED_QUANTIZE", "false").lower() == "true"
+# Intra-op CPU threads; 0 leaves the runtime default
+LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", 0))
+LOCAL_EMBED_ONNX_DIR = Path(os.getenv("LOCAL_EMBED_ONNX_DIR", "uploads/models"))
+LOCAL_EMBED_MAX_LENGTH = 512
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface for the models Embeddings can run on.
+
+    A backend splits texts into the batches it can embed in one call and
+    embeds one such batch. `model` names what produced the vectors (it keys
+    caches and is recorded on the collection) and `dimension` is their size.
+    """
+    model: str
+    dimension: int
+
+    @abstractmethod
+    def batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into the batches one embed call can take"""
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch of texts, in order"""
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, model=EMBEDDING_MODEL, max_inputs=EMBED_BATCH_MAX_INPUTS, max_tokens=EMBED_BATCH_MAX_TOKENS):
+        self.model = model
+        self.dimension = OPENAI_EMBEDDING_DIMENSIONS.get(model)
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        """The tokenizer, loaded on first use since tiktoken fetches it over the network"""
+        if self._encoding is None:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        return self._encoding
+
+    def batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indices into sub-batches under the input and token limits"""
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for i, text in enumerate(texts):
+            num_tokens = len(self.encoding.encode(text, disallowed_special=()))
+            if current and (len(current) >= self.max_inputs or current_tokens + num_tokens > self.max_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += num_tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Send one embeddings request, retrying with exponential backoff"""
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                response = get_openai().embeddings.create(
+                    input=texts,
+                    model=self.model
+                )
+                # The API tags each embedding with the index of its input
+                ordered = sorted(response.data, key=lambda item: item.index)
+                return [item.embedding for item in ordered]
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise
+                print(f"Embedding batch of {len(texts)} failed (attempt {attempt + 1}): {e}")
+                time.sleep(2 ** attempt)
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Sentence-transformers model run on the local CPU: no network round trip and works offline.
+
+    Produces mean-pooled, L2-normalised embeddings. With runtime "onnx" the
+    model is exported to ONNX on first use and served by onnxruntime;
+    quantize applies dynamic int8 quantization in either runtime.
+    """
+
+    def __init__(
+        self,
+        model_id: str = LOCAL_EMBED_MODEL,
+        batch_size: int = LOCAL_EMBED_BATCH_SIZE,
+        runtime: str = LOCAL_EMBED_RUNTIME,
+        quantize: bool = LOCAL_EMBED_QUANTIZE,
+        threads: int = LOCAL_EMBED_THREADS
+    ):
+        from transformers import AutoConfig
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.runtime = runtime
+        self.quantize = quantize
+        self.threads = threads
+        # Quantized weights give slightly different vectors, so they count as a different model
+        self.model = f"{model_id}{'-int8' if quantize else ''}"
+        self.dimension = AutoConfig.from_pretrained(model_id).hidden_size
+        self._tokenizer = None
+        self._torch_model = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def batches(self, texts: List[str]) -> List[List[int]]:
+        return [list(range(start, min(start + self.batch_size, len(texts)))) for start in range(0, len(texts), self.batch_size)]
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._tokenizer is not None:
+                return
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+            if self.runtime == "onnx":
+                self._session = self._load_onnx_session()
+            else:
+                import torch
+                from transformers import AutoModel
+                if self.threads > 0:
+                    torch.set_num_threads(self.threads)
+                model = AutoModel.from_pretrained(self.model_id).eval()
+                if self.quantize:
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._torch_model = model
+            self._tokenizer = tokenizer
+
+    def _load_onnx_session(self):
+        import onnxruntime
+        onnx_path = self._export_onnx()
+        if self.quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantized_path = onnx_path.with_name(onnx_path.stem + "-int8.onnx")
+            if not quantized_path.exists():
+                quantize_dynamic(str(onnx_path), str(quantized_path), weight_type=QuantType.QInt8)
+            onnx_path = quantized_path
+
+        options = onnxruntime.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        return onnxruntime.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+
+    def _export_onnx(self) -> Path:
+        """Export the transformer to ONNX once; later processes reuse the file"""
+        onnx_path = LOCAL_EMBED_ONNX_DIR / f"{self.model_id.replace('/', '__')}.onnx"
+        if onnx_path.exists():
+            return onnx_path
+
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        onnx_path.parent.mkdir(parents=True, exist_ok=True)
+        model = AutoModel.from_pretrained(self.model_id).eval()
+        sample = AutoTokenizer.from_pretrained(self.model_id)(["export"], return_tensors="pt")
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ("input_ids", "attention_mask", "token_type_ids", "last_hidden_state")}
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(onnx_path),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17
+        )
+        return onnx_path
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+        self._load()
+        inputs = self._tokenizer(texts, padding=True, truncation=True, max_length=LOCAL_EMBED_MAX_LENGTH, return_tensors="np")
+
+        if self._session is not None:
+            feed = {i.name: inputs[i.name].astype(np.int64) for i in self._session.get_inputs()}
+            hidden = self._session.run(None, feed)[0]
+        else:
+            import torch
+            with torch.inference_mode():
+                hidden = self._torch_model(**{name: torch.from_numpy(value) for name, value in inputs.items()}).last_hidden_state.numpy()
+
+        # Mean over real tokens, then unit length, as sentence-transformers does for this model
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+
+def create_embedding_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    name = name or EMBEDDING_BACKEND
+    if name == "openai":
+        return OpenAIEmbeddingBackend()
+    if name == "local":
+        return LocalEmbeddingBackend()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {name!r}; expected 'openai' or 'local'")
@@ -0,0 +1,30 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Upper bound on short blocking calls (sync SDKs, Docling) in flight at once
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 16))
+# Agent runs take minutes, so they get their own pool and cannot starve the calls above
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", 4))
+
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+agent_executor = ThreadPoolExecutor(max_workers=AGENT_POOL_SIZE, thread_name_prefix="agent")
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable on the shared bounded thread pool.
+
+    Use this for every sync SDK call made from an async route so that one
+    slow request cannot stall the event loop for the whole worker.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_agent(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a long blocking agent call on the agent pool; further runs queue once it is full"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(agent_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,122 @@
+import os
+import time
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+IMAGE_HASH_CACHE_ENABLED = os.getenv("IMAGE_HASH_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_HASH_CACHE_PATH = os.getenv("IMAGE_HASH_CACHE_PATH", "uploads/cache/image_hashes.sqlite3")
+IMAGE_HASH_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_HASH_CACHE_MAX_ENTRIES", 50000))
+# Largest number of differing bits (out of 64) for two images to count as the same shot
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", 6))
+
+
+class ImageHashCache:
+    """
+    Disk-backed index of described images, looked up by perceptual hash.
+
+    Each entry holds the 64-bit difference hash of an image with its vision
+    description and embedding. A lookup returns the closest entry within
+    max_distance bits, so near-identical photos of the same scene reuse one
+    description. The embedding is only returned for the embedding model that
+    produced it; under another model the caller re-embeds the description.
+    The hashes are also kept in memory for the linear scan; entries are
+    evicted least-recently-used beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str = IMAGE_HASH_CACHE_PATH,
+        max_entries: int = IMAGE_HASH_CACHE_MAX_ENTRIES,
+        max_distance: int = IMAGE_HASH_MAX_DISTANCE
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS image_hashes (
+                hash TEXT PRIMARY KEY,
+                description TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                embedding_model TEXT,
+                last_access REAL NOT NULL
+            )"""
+        )
+        # Caches created before the embedding model was recorded
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(image_hashes)")]
+        if "embedding_model" not in columns:
+            self._conn.execute("ALTER TABLE image_hashes ADD COLUMN embedding_model TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_image_hashes_last_access ON image_hashes(last_access)")
+        self._conn.commit()
+        self._hashes = {int(row[0], 16) for row in self._conn.execute("SELECT hash FROM image_hashes")}
+
+    def find(self, image_hash: int, embedding_model: str) -> Optional[Tuple[str, Optional[List[float]], int]]:
+        """
+        Return (description, embedding, distance) of the nearest cached image,
+        or None. The embedding is None if it was made by another embedding model.
+        """
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for cached in self._hashes:
+                distance = (cached ^ image_hash).bit_count()
+                if distance < best_distance:
+                    best, best_distance = cached, distance
+                    if distance == 0:
+                        break
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            key = f"{best:016x}"
+            description, blob, cached_model = self._conn.execute(
+                "SELECT description, embedding, embedding_model FROM image_hashes WHERE hash = ?", (key,)
+            ).fetchone()
+            self._conn.execute("UPDATE image_hashes SET last_access = ? WHERE hash = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        embedding = array("f", blob).tolist() if cached_model == embedding_model else None
+        return description, embedding, best_distance
+
+    def add(self, image_hash: int, description: str, embedding: List[float], embedding_model: str) -> None:
+        """Record the description and embedding of a newly described image"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO image_hashes (hash, description, embedding, embedding_model, last_access) VALUES (?, ?, ?, ?, ?)",
+                (f"{image_hash:016x}", description, array("f", embedding).tobytes(), embedding_model, time.time())
+            )
+            self._hashes.add(image_hash)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        overflow = len(self._hashes) - self.max_entries
+        if overflow > 0:
+            rows = self._conn.execute(
+                "SELECT hash FROM image_hashes ORDER BY last_access ASC LIMIT ?", (overflow,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM image_hashes WHERE hash = ?", rows)
+            self._hashes.difference_update(int(row[0], 16) for row in rows)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            entries = len(self._hashes)
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None
+        }
@@ -1,33 +1,98 @@
 import os
+import io
+import json
 import base64
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+import mimetypes
+from typing import List, Optional, Tuple
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .executor import run_blocking
+from .services import get_async_openai
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API")
-client = OpenAI(api_key = OPENAI_API_KEY)
+# Longest edge sent to the vision model; larger photos are downscaled first
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1536))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 80))
+# Images described together in one vision request; 1 sends every image on its own
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", 4))
+# How long a partly filled batch waits for more images before it is sent
+IMAGE_BATCH_WAIT_MS = int(os.getenv("IMAGE_BATCH_WAIT_MS", 200))
+
+DESCRIPTION_PROMPT = "The image is coming from construction sites, what is the image in the context of construction?"
+
+
+def prepare_image(image_path: str) -> Tuple[bytes, str]:
+    """
+    Shrink an image for a vision request.
+
+    Applies the EXIF orientation, downscales so the longest edge is at most
+    IMAGE_MAX_EDGE and re-encodes as JPEG (PNG when the image has
+    transparency). Files Pillow cannot read are sent unchanged.
+
+    Returns:
+        Tuple of (encoded bytes, MIME type)
+    """
+    try:
+        with Image.open(image_path) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+            
+            buffer = io.BytesIO()
+            if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+                image.save(buffer, format="PNG", optimize=True)
+                return buffer.getvalue(), "image/png"
+            image.convert("RGB").save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+            return buffer.getvalue(), "image/jpeg"
+    except (UnidentifiedImageError, OSError):
+        with open(image_path, "rb") as image_file:
+            return image_file.read(), mimetypes.guess_type(image_path)[0] or "image/jpeg"
+
+
+def dhash(image_path: str, hash_size: int = 8) -> int:
+    """
+    Perceptual difference hash of an image as a hash_size**2-bit integer.
+
+    Each bit records whether a pixel of the shrunken greyscale image is
+    brighter than its right neighbour, so re-encoding, resizing and small
+    shifts in framing change only a few bits.
+    """
+    with Image.open(image_path) as image:
+        image = ImageOps.exif_transpose(image).convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = list(image.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
 
 
 class ImageProcessing:
-    def _init__(self, model="gpt-4.1"):
+    def __init__(self, model="gpt-4.1", batch_size=IMAGE_BATCH_SIZE):
         self.model = model
+        self.batch_size = batch_size
+        # Images waiting to be sent in the next batch, with the futures their callers await
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
 
     def encode_image(self, image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
+        """Return the downscaled image as a base64 data URL with its real MIME type"""
+        data, mime_type = prepare_image(image_path)
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
 
-    def image_description(self, image_path):
-        base64_image = self.encode_image(image_path)
-        response = client.responses.create(
-        model="gpt-4.1",
+    async def image_description(self, image_path):
+        image_url = await run_blocking(self.encode_image, image_path)
+        response = await get_async_openai().responses.create(
+        model=self.model,
         input=[
             {
                 "role": "user",
                 "content": [
-                    { "type": "input_text", "text": "The image is coming from construction sites, what is the image in the context of construction?"},
+                    { "type": "input_text", "text": DESCRIPTION_PROMPT},
                     {
                         "type": "input_image",
-                        "image_url": f"data:image/jpeg;base64,{base64_image}",
+                        "image_url": image_url,
                     },
                 ],
             }
@@ -35,3 +100,98 @@ class ImageProcessing:
     )
 
         return response.output_text
+
+    async def describe(self, image_path: str) -> str:
+        """
+        Describe one image, batching it with other images requested at about the same time.
+
+        Calls are collected until batch_size images are waiting or
+        IMAGE_BATCH_WAIT_MS has passed, then described in one request.
+        """
+        if self.batch_size <= 1:
+            return await self.image_description(image_path)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_path, future))
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(IMAGE_BATCH_WAIT_MS / 1000, self._start_flush)
+        return await future
+
+    def _start_flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference so the task is not garbage collected mid-flight
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            descriptions = await self.describe_images([path for path, _ in batch])
+        except Exception as e:
+            # One bad image must not fail its neighbours; describe each on its own instead
+            print(f"Batched description of {len(batch)} images failed, describing them one by one: {e}")
+            descriptions = await asyncio.gather(
+                *(self.image_description(path) for path, _ in batch),
+                return_exceptions=True
+            )
+        for (_, future), description in zip(batch, descriptions):
+            if future.done():
+                continue
+            if isinstance(description, BaseException):
+                future.set_exception(description)
+            else:
+                future.set_result(description)
+
+    async def describe_images(self, image_paths: List[str]) -> List[str]:
+        """
+        Describe several images in one vision request.
+
+        The model is asked for a JSON list of descriptions keyed by image
+        number, which is mapped back to image_paths. Images whose description
+        is missing, or the whole batch if the response cannot be parsed, are
+        described with one request each instead.
+        
+        Returns:
+            Descriptions in the order of image_paths
+        """
+        if len(image_paths) == 1:
+            return [await self.image_description(image_paths[0])]
+        
+        image_urls = await asyncio.gather(*(run_blocking(self.encode_image, path) for path in image_paths))
+        content = [{
+            "type": "input_text",
+            "text": f"{DESCRIPTION_PROMPT}\n\nYou are given {len(image_paths)} numbered images. Describe each one separately. "
+                    'Respond with JSON only, in the form {"descriptions": [{"image": <number>, "description": "<text>"}]}, '
+                    "with one entry per image."
+        }]
+        for number, image_url in enumerate(image_urls, start=1):
+            content.append({"type": "input_text", "text": f"Image {number}:"})
+            content.append({"type": "input_image", "image_url": image_url})
+        
+        response = await get_async_openai().responses.create(
+            model=self.model,
+            input=[{"role": "user", "content": content}],
+            text={"format": {"type": "json_object"}}
+        )
+        
+        descriptions: List[Optional[str]] = [None] * len(image_paths)
+        try:
+            for entry in json.loads(response.output_text)["descriptions"]:
+                index = int(entry["image"]) - 1
+                if 0 <= index < len(image_paths) and entry.get("description"):
+                    descriptions[index] = str(entry["description"])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Could not parse batched image descriptions, describing images one by one: {e}")
+        
+        missing = [i for i, description in enumerate(descriptions) if description is None]
+        fallback = await asyncio.gather(*(self.image_description(image_paths[i]) for i in missing))
+        for i, description in zip(missing, fallback):
+            descriptions[i] = description
+        return descriptions
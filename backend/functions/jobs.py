@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "uploads/jobs/jobs.sqlite3")
+JOBS_UPLOAD_DIR = Path(os.getenv("JOBS_UPLOAD_DIR", "uploads/jobs/files"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+
+# Job and per-file states
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+COMPLETED_WITH_ERRORS = "completed_with_errors"
+
+
+def create_job_id() -> str:
+    return f"job_{uuid.uuid4().hex[:12]}"
+
+
+class JobStore:
+    """
+    SQLite-backed record of ingestion jobs and the state of each of their files.
+
+    Survives restarts, so jobs that were queued or running when the process
+    stopped can be picked up again.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                case_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT NOT NULL,
+                file_index INTEGER NOT NULL,
+                modality TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                content_hash TEXT,
+                upload_id TEXT,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, file_index)
+            );
+            """
+        )
+        # Databases created before content hashes and upload IDs were recorded
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(job_files)")]
+        for column in ("content_hash", "upload_id"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE job_files ADD COLUMN {column} TEXT")
+        self._conn.commit()
+
+    def create_job(self, job_id: str, case_id: str, files: List[Dict[str, str]]) -> None:
+        """
+        Record a new job. Each file is a dict with modality, filename, path and
+        content_hash; each is given the upload_id its vectors will be tagged with.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, case_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, case_id, QUEUED, now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_files (job_id, file_index, modality, filename, path, content_hash, upload_id, status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job_id, i, f["modality"], f["filename"], f["path"], f.get("content_hash"), uuid.uuid4().hex, QUEUED, now) for i, f in enumerate(files)]
+            )
+            self._conn.commit()
+
+    def set_job_status(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, updated_at = ? WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def set_file_status(self, job_id: str, file_index: int, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_files SET status = ?, result = COALESCE(?, result), error = ?, updated_at = ? WHERE job_id = ? AND file_index = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, file_index)
+            )
+            self._conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job with its files in upload order, or None if unknown"""
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = self._conn.execute(
+                "SELECT * FROM job_files WHERE job_id = ? ORDER BY file_index", (job_id,)
+            ).fetchall()
+
+        job = dict(job)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["files"] = []
+        for row in files:
+            file_info = dict(row)
+            file_info["result"] = json.loads(file_info["result"]) if file_info["result"] else None
+            job["files"].append(file_info)
+        return job
+
+    def unfinished_job_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, PROCESSING)
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def fail_lost_files(self, job_id: str) -> int:
+        """
+        Mark the job's unfinished files whose upload is no longer on disk as
+        failed, returning how many were lost.
+        """
+        job = self.get_job(job_id)
+        lost = 0
+        for job_file in job["files"]:
+            if job_file["status"] in (COMPLETED, FAILED):
+                continue
+            if not Path(job_file["path"]).exists():
+                lost += 1
+                error = "Uploaded file was lost before processing finished"
+                self.set_file_status(job_id, job_file["file_index"], FAILED, result={
+                    "case_id": job["case_id"],
+                    "original_filename": job_file["filename"],
+                    "error": error
+                }, error=error)
+        return lost
+
+
+class JobQueue:
+    """In-process worker pool that runs queued jobs through a handler coroutine"""
+
+    def __init__(self, store: JobStore, handler: Callable[[Dict[str, Any]], Awaitable[None]], workers: int = JOB_WORKERS):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Start the workers and re-enqueue jobs left unfinished by a previous run.
+        
+        Files whose upload is gone are marked failed. A job is resumed even
+        if all its files are done, since it may have stopped before generating
+        its tasks; only a job whose files were lost and which has no other
+        file left to use fails.
+        """
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+        for job_id in self.store.unfinished_job_ids():
+            lost = self.store.fail_lost_files(job_id)
+            files = self.store.get_job(job_id)["files"]
+            if lost and all(job_file["status"] == FAILED for job_file in files):
+                self.store.set_job_status(job_id, FAILED, error="No uploaded files left to process after restart")
+            else:
+                self._queue.put_nowait(job_id)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, job_id: str) -> None:
+        self._queue.put_nowait(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.store.get_job(job_id)
+                if job is not None:
+                    await self.handler(job)
+            except Exception as e:
+                print(f"Error running job {job_id}: {e}")
+                self.store.set_job_status(job_id, FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
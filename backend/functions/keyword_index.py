@@ -0,0 +1,149 @@
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "true").lower() == "true"
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", "uploads/cache/keyword_index.sqlite3")
+# Rank offset in reciprocal rank fusion; larger values flatten the advantage of top ranks
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Metadata fields stored next to each chunk so keyword searches can be filtered like vector searches
+FILTER_FIELDS = ("case_id", "doc_type", "original_filename")
+
+_TOKEN = re.compile(r"\w+")
+
+
+def to_match_query(query: str) -> Optional[str]:
+    """
+    FTS5 query matching any term of the query, or the query as a phrase.
+
+    Identifiers such as "03 30 00" or "RFI-012" are split into their parts
+    by the tokenizer; the extra phrase term ranks chunks containing the
+    whole identifier above chunks containing only some of its parts.
+    """
+    tokens = _TOKEN.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in dict.fromkeys(tokens)]
+    if len(tokens) > 1:
+        terms.append(f'"{" ".join(tokens)}"')
+    return " OR ".join(terms)
+
+
+def collection_index_path(collection_name: str, path: str = KEYWORD_INDEX_PATH) -> str:
+    """Index file for one collection, so switching collections never inherits another's entries"""
+    if path == ":memory:":
+        return path
+    stem, extension = os.path.splitext(path)
+    return f"{stem}_{collection_name}{extension}"
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse several best-first rankings of IDs into one, scoring each ID by sum(1 / (k + rank))"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, record_id in enumerate(ranking, start=1):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class KeywordIndex:
+    """
+    Local BM25 inverted index over chunk texts, kept in step with the vector store.
+
+    Backed by an SQLite FTS5 table holding each chunk's ID, text and the
+    metadata fields searches filter on. Updates are incremental: records are
+    upserted and deleted by ID as the vector store is written.
+    """
+
+    def __init__(self, path: str = KEYWORD_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                id UNINDEXED,
+                text,
+                {", ".join(f"{field} UNINDEXED" for field in FILTER_FIELDS)}
+            )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def upsert(self, ids: List[str], documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        documents = documents or ["" for _ in ids]
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            self._delete(ids)
+            self._conn.executemany(
+                f"INSERT INTO chunks (id, text, {', '.join(FILTER_FIELDS)}) VALUES (?, ?, {', '.join('?' * len(FILTER_FIELDS))})",
+                [
+                    (record_id, document or "", *(metadata.get(field) for field in FILTER_FIELDS))
+                    for record_id, document, metadata in zip(ids, documents, metadatas)
+                ]
+            )
+            self._conn.commit()
+
+    def update(self, ids: List[str], documents: Optional[List[str]] = None, metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Apply a partial update: new texts and/or changes to the filter fields"""
+        with self._lock:
+            for i, record_id in enumerate(ids):
+                changes = {}
+                if documents is not None:
+                    changes["text"] = documents[i]
+                if metadatas is not None:
+                    changes.update({field: metadatas[i][field] for field in FILTER_FIELDS if field in metadatas[i]})
+                if changes:
+                    assignments = ", ".join(f"{column} = ?" for column in changes)
+                    self._conn.execute(f"UPDATE chunks SET {assignments} WHERE id = ?", (*changes.values(), record_id))
+            self._conn.commit()
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._delete(ids)
+            self._conn.commit()
+
+    def _delete(self, ids: List[str]) -> None:
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def search(self, query: str, k: int, **filters: Optional[str]) -> List[str]:
+        """
+        IDs of the k chunks ranking best for the query under BM25, best first.
+
+        Keyword filters (case_id, doc_type, original_filename) restrict the
+        search to chunks with those values.
+        """
+        match = to_match_query(query)
+        if match is None:
+            return []
+        conditions = [(field, value) for field, value in filters.items() if value and field in FILTER_FIELDS]
+        sql = "SELECT id FROM chunks WHERE chunks MATCH ?"
+        sql += "".join(f" AND {field} = ?" for field, _ in conditions)
+        sql += " ORDER BY bm25(chunks) LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (match, *(value for _, value in conditions), k)).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def backfilled(self) -> bool:
+        """Whether every record stored before the index existed has been indexed"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM settings WHERE key = 'backfilled'").fetchone() is not None
+
+    def mark_backfilled(self) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('backfilled', '1')")
+            self._conn.commit()
@@ -0,0 +1,82 @@
+import os
+import asyncio
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+from .executor import run_blocking
+
+# Chunks embedded per request and handed to the upsert stage together
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+# Batches that may wait between two stages before the upstream stage pauses
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", 2))
+
+# (id, text, metadata) for one vector record
+Record = Tuple[str, str, Dict[str, Any]]
+
+_DONE = object()
+
+
+def _next_batch(records: Iterator[Record], batch_size: int) -> List[Record]:
+    return list(islice(records, batch_size))
+
+
+async def stream_embed_upsert(
+    records: Iterable[Record],
+    embed_batch: Callable[[List[str]], List[List[float]]],
+    upsert: Callable[..., Any],
+    max_upsert_size: int,
+    batch_size: int = INGEST_BATCH_SIZE,
+    queue_depth: int = INGEST_QUEUE_DEPTH
+) -> int:
+    """
+    Embed and store records as three overlapping stages: read, embed and upsert.
+
+    The stages are connected by bounded queues, so a slow stage pauses the
+    ones before it and only a few batches of vectors are held in memory at
+    any time, however many records there are. Each upsert call sends at most
+    max_upsert_size records. Returns the number of records stored.
+    """
+    records = iter(records)
+    to_embed: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_depth))
+    to_upsert: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_depth))
+    stored = 0
+
+    async def read_stage():
+        while True:
+            # The record iterator may do real work (chunking, file writes), so pull off the loop
+            batch = await run_blocking(_next_batch, records, batch_size)
+            if not batch:
+                break
+            await to_embed.put(batch)
+        await to_embed.put(_DONE)
+
+    async def embed_stage():
+        while (batch := await to_embed.get()) is not _DONE:
+            embeddings = await run_blocking(embed_batch, [text for _, text, _ in batch])
+            await to_upsert.put((batch, embeddings))
+        await to_upsert.put(_DONE)
+
+    async def upsert_stage():
+        nonlocal stored
+        while (item := await to_upsert.get()) is not _DONE:
+            batch, embeddings = item
+            for start in range(0, len(batch), max(1, max_upsert_size)):
+                part = batch[start:start + max_upsert_size]
+                await run_blocking(
+                    upsert,
+                    ids=[record_id for record_id, _, _ in part],
+                    documents=[text for _, text, _ in part],
+                    embeddings=embeddings[start:start + max_upsert_size],
+                    metadatas=[metadata for _, _, metadata in part]
+                )
+                stored += len(part)
+
+    tasks = [asyncio.create_task(stage()) for stage in (read_stage, embed_stage, upsert_stage)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # A failed stage would leave the others waiting on their queues forever
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return stored
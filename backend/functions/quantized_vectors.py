@@ -0,0 +1,266 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# "chroma" keeps vectors in Chroma; "quantized" keeps them in a QuantizedVectorStore,
+# leaving Chroma with texts and metadata only
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+QUANTIZED_STORE_PATH = os.getenv("QUANTIZED_STORE_PATH", "uploads/vectors")
+# Directory for the full-precision vectors that quantized case indexes re-score from
+QUANTIZED_VECTORS_DIR = os.getenv("QUANTIZED_VECTORS_DIR", "uploads/cache/vectors")
+# Candidates re-scored exactly per result wanted, after the int8 first pass
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", 4))
+
+
+def quantize(embeddings: np.ndarray):
+    """Symmetric int8 scalar quantization with one scale per vector: x ~= scale * code"""
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def rescore_search(codes: np.ndarray, scales: np.ndarray, norms: np.ndarray, full: np.ndarray,
+                   query: np.ndarray, k: int, rows: np.ndarray, rescore_factor: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (rows, squared L2 distances) of the k nearest of the given rows, best
+    first: all rows are ranked from their int8 codes, then the best
+    k * rescore_factor are re-scored exactly from the float32 vectors.
+    """
+    k = min(k, len(rows))
+    if k == 0:
+        return rows[:0], np.zeros(0, dtype=np.float32)
+
+    # NumPy has no fast int8 product, so upcast a block of codes at a time
+    dots = np.concatenate([
+        codes[rows[start:start + 1024]].astype(np.float32) @ query
+        for start in range(0, len(rows), 1024)
+    ])
+    approximate = norms[rows] - 2 * scales[rows] * dots + query @ query
+
+    candidates = min(len(rows), k * rescore_factor)
+    shortlist = np.argpartition(approximate, candidates - 1)[:candidates] if candidates < len(rows) else np.arange(len(rows))
+    shortlisted = rows[shortlist]
+    # Sorted reads keep the accesses to the mapped file sequential
+    order = np.argsort(shortlisted)
+    exact = np.empty(len(shortlisted), dtype=np.float32)
+    exact[order] = norms[shortlisted[order]] - 2 * (np.asarray(full[shortlisted[order]]) @ query) + query @ query
+    best = np.argsort(exact)[:k]
+    return shortlisted[best], np.maximum(exact[best], 0)
+
+
+class QuantizedVectors:
+    """
+    Compact store of embeddings for squared-L2 search with exact re-scoring.
+
+    Only int8 codes, one scale per vector and the exact squared norms stay
+    in memory, about a quarter of float32. The first pass ranks every
+    vector from the codes; the best candidates are then re-scored with the
+    float32 vectors, read from a memory-mapped file so that only the pages
+    of those candidates are touched.
+    """
+
+    def __init__(self, embeddings, directory: Optional[str] = QUANTIZED_VECTORS_DIR, rescore_factor: int = QUANTIZED_RESCORE_FACTOR):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.rescore_factor = rescore_factor
+        self.codes, self.scales = quantize(embeddings)
+        self.norms = np.einsum("ij,ij->i", embeddings, embeddings)
+        self.full = self._spill(embeddings, directory)
+
+    @staticmethod
+    def _spill(embeddings: np.ndarray, directory: Optional[str]) -> np.ndarray:
+        if directory is None:
+            return embeddings
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".f32", dir=directory)
+        os.close(fd)
+        spilled = np.memmap(path, dtype=np.float32, mode="w+", shape=embeddings.shape)
+        spilled[:] = embeddings
+        spilled.flush()
+        del spilled
+        full = np.memmap(path, dtype=np.float32, mode="r", shape=embeddings.shape)
+        try:
+            # The mapping stays readable after the name is gone, and the space is freed with it
+            os.remove(path)
+        except OSError:
+            pass
+        return full
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in memory; the memory-mapped vectors are paged in on demand"""
+        return self.codes.nbytes + self.scales.nbytes + self.norms.nbytes
+
+    def search(self, query, k: int, rows: Optional[np.ndarray] = None):
+        """
+        (rows, squared L2 distances) of the k nearest vectors, best first,
+        optionally among the given rows only.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        return rescore_search(self.codes, self.scales, self.norms, self.full, query, k, rows, self.rescore_factor)
+
+
+class QuantizedVectorStore:
+    """
+    Persistent vector store: int8 codes in memory, float32 vectors on disk.
+
+    With VECTOR_STORE=quantized, VectorDB keeps every embedding here rather
+    than in Chroma, which then holds only texts and metadata. Per vector,
+    memory holds the int8 codes plus a scale and the exact squared norm;
+    the float32 originals stay in a file that searches memory-map to
+    re-score their best candidates. Record IDs map to rows in an SQLite
+    table, and rows freed by deletes are reused.
+    """
+
+    def __init__(self, path: str = QUANTIZED_STORE_PATH, dimension: Optional[int] = None,
+                 rescore_factor: int = QUANTIZED_RESCORE_FACTOR):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.rescore_factor = rescore_factor
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.path / "rows.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        stored = self._conn.execute("SELECT value FROM settings WHERE key = 'dimension'").fetchone()
+        if stored and dimension and int(stored[0]) != dimension:
+            raise ValueError(
+                f"Vector store {path!r} holds {stored[0]}-dimensional vectors, but the configured "
+                f"backend produces {dimension}. Set QUANTIZED_STORE_PATH to a store for this model."
+            )
+        if stored is None and dimension:
+            self._conn.execute("INSERT INTO settings (key, value) VALUES ('dimension', ?)", (str(dimension),))
+        self._conn.commit()
+        self.dimension = int(stored[0]) if stored else dimension
+
+        self._codes_path = self.path / "codes.i8"
+        self._params_path = self.path / "params.f32"
+        self._vectors_path = self.path / "vectors.f32"
+        for file_path in (self._codes_path, self._params_path, self._vectors_path):
+            file_path.touch()
+
+        self._rows: Dict[str, int] = dict(self._conn.execute("SELECT id, row FROM rows"))
+        self._ids: Dict[int, str] = {row: record_id for record_id, row in self._rows.items()}
+        d = self.dimension or 1
+        self._size = self._params_path.stat().st_size // 8
+        self._codes = np.fromfile(self._codes_path, dtype=np.int8)[:self._size * d].reshape(-1, d)
+        params = np.fromfile(self._params_path, dtype=np.float32)[:self._size * 2].reshape(-1, 2)
+        self._scales = params[:, 0].copy()
+        self._norms = params[:, 1].copy()
+        self._live = np.zeros(self._size, dtype=bool)
+        self._live[list(self._ids)] = True
+        self._free = sorted(set(range(self._size)) - set(self._ids), reverse=True)
+        self._full = None
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def _reserve(self, size: int) -> None:
+        """Grow the in-memory arrays, doubling their capacity, to hold size rows"""
+        if size <= len(self._codes):
+            return
+        capacity = max(size, 2 * len(self._codes), 1024)
+        for name in ("_codes", "_scales", "_norms", "_live"):
+            old = getattr(self, name)
+            grown = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def _vectors(self) -> np.ndarray:
+        if self._full is None or len(self._full) < self._size:
+            self._full = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._size, self.dimension)) if self._size else np.zeros((0, self.dimension), dtype=np.float32)
+        return self._full
+
+    def upsert(self, ids: List[str], embeddings) -> None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if not len(ids):
+            return
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+                self._codes = self._codes.reshape(-1, self.dimension)
+                self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('dimension', ?)", (str(self.dimension),))
+            if embeddings.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dimensional embeddings, got {embeddings.shape[1]}")
+
+            rows = []
+            for record_id in ids:
+                row = self._rows.get(record_id)
+                if row is None:
+                    row = self._free.pop() if self._free else self._size
+                    self._size = max(self._size, row + 1)
+                    self._rows[record_id] = row
+                    self._ids[row] = record_id
+                rows.append(row)
+            self._reserve(self._size)
+
+            codes, scales = quantize(embeddings)
+            norms = np.einsum("ij,ij->i", embeddings, embeddings)
+            with open(self._codes_path, "r+b") as codes_file, open(self._params_path, "r+b") as params_file, \
+                    open(self._vectors_path, "r+b") as vectors_file:
+                for i, row in enumerate(rows):
+                    codes_file.seek(row * self.dimension)
+                    codes_file.write(codes[i].tobytes())
+                    params_file.seek(row * 8)
+                    params_file.write(np.array([scales[i], norms[i]], dtype=np.float32).tobytes())
+                    vectors_file.seek(row * self.dimension * 4)
+                    vectors_file.write(embeddings[i].tobytes())
+            rows = np.asarray(rows)
+            self._codes[rows] = codes
+            self._scales[rows] = scales
+            self._norms[rows] = norms
+            self._live[rows] = True
+
+            self._conn.executemany("INSERT OR REPLACE INTO rows (id, row) VALUES (?, ?)", zip(ids, rows.tolist()))
+            self._conn.commit()
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            freed = [self._rows.pop(record_id) for record_id in ids if record_id in self._rows]
+            for row in freed:
+                del self._ids[row]
+                self._live[row] = False
+            self._free = sorted(set(self._free) | set(freed), reverse=True)
+            self._conn.executemany("DELETE FROM rows WHERE id = ?", [(record_id,) for record_id in ids])
+            self._conn.commit()
+
+    def get(self, ids: List[str]) -> List[Optional[List[float]]]:
+        """The full-precision embeddings of the given records, None for unknown IDs"""
+        with self._lock:
+            rows = [self._rows.get(record_id) for record_id in ids]
+            full = self._vectors()
+            return [full[row].tolist() if row is not None else None for row in rows]
+
+    def search(self, query, k: int, ids: Optional[List[str]] = None) -> Tuple[List[str], List[float]]:
+        """
+        IDs and squared L2 distances of the k nearest vectors, best first;
+        among the given IDs only when ids is not None.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            if ids is None:
+                rows = np.flatnonzero(self._live[:self._size])
+            else:
+                rows = np.asarray([self._rows[record_id] for record_id in ids if record_id in self._rows], dtype=np.int64)
+            # Growing the store swaps in new arrays, so these references stay valid outside the lock
+            codes, scales, norms, full, row_ids = self._codes, self._scales, self._norms, self._vectors(), dict(self._ids)
+        found, distances = rescore_search(codes, scales, norms, full, query, k, rows, self.rescore_factor)
+        return [row_ids[row] for row in found.tolist()], distances.tolist()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "vectors": len(self._rows),
+                "dimension": self.dimension,
+                "memory_bytes": int(self._size * ((self.dimension or 0) + 8)),
+                "disk_bytes": sum(p.stat().st_size for p in (self._codes_path, self._params_path, self._vectors_path))
+            }
@@ -0,0 +1,64 @@
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional
+from cachetools import TTLCache
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 1024))
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", 300))
+
+
+def normalize_query(query: str) -> str:
+    """Collapse case and whitespace so trivially different phrasings share an entry"""
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """
+    In-process LRU caches, with a TTL, for query embeddings and search results.
+
+    Result entries are keyed by the vector store's collection version as well
+    as the query, filters and k, so any write to the collection makes earlier
+    results unreachable. The TTL bounds staleness from writes made by other
+    processes.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: int = QUERY_CACHE_TTL_SECONDS):
+        self._embeddings = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._results = TTLCache(maxsize=max_entries, ttl=ttl)
+        # cachetools caches are not thread-safe
+        self._lock = threading.Lock()
+        self.counters = {"embedding_hits": 0, "embedding_misses": 0, "result_hits": 0, "result_misses": 0}
+
+    @staticmethod
+    def result_key(version: int, query: str, where: Optional[Dict[str, Any]], k: int, mode: str = "vector") -> str:
+        return json.dumps([version, normalize_query(query), where, k, mode], sort_keys=True, default=str)
+
+    def get_embedding(self, model: str, query: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._embeddings.get((model, normalize_query(query)))
+            self.counters["embedding_hits" if embedding is not None else "embedding_misses"] += 1
+        return embedding
+
+    def put_embedding(self, model: str, query: str, embedding: List[float]) -> None:
+        with self._lock:
+            self._embeddings[(model, normalize_query(query))] = embedding
+
+    def get_result(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._results.get(key)
+            self.counters["result_hits" if result is not None else "result_misses"] += 1
+        return result
+
+    def put_result(self, key: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._results[key] = result
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            stats = dict(self.counters, embedding_entries=len(self._embeddings), result_entries=len(self._results))
+        for kind in ("embedding", "result"):
+            total = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = stats[f"{kind}_hits"] / total if total else None
+        return stats
@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Chunks retrieved for reranking, and how many of the best are kept for the prompt
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 50))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", 5))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))
+# Scoring stops once this much time has passed; candidates not yet scored keep their retrieval order
+RERANK_LATENCY_BUDGET_MS = int(os.getenv("RERANK_LATENCY_BUDGET_MS", 500))
+# Torch intra-op threads for scoring; 0 leaves the torch default
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", 0))
+
+
+class CrossEncoderReranker:
+    """
+    Reorders retrieved chunks with a small cross-encoder run locally on CPU.
+
+    Each (query, chunk) pair is scored jointly by the model, which ranks
+    relevance better than embedding distance, so fewer chunks need to be
+    sent to the LLM. Scoring runs in batches of batch_size and stops when
+    the latency budget is spent.
+    """
+
+    def __init__(
+        self,
+        model_id: str = RERANK_MODEL,
+        candidates: int = RERANK_CANDIDATES,
+        top_n: int = RERANK_TOP_N,
+        batch_size: int = RERANK_BATCH_SIZE,
+        latency_budget_ms: int = RERANK_LATENCY_BUDGET_MS
+    ):
+        self.model_id = model_id
+        self.candidates = candidates
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.latency_budget_ms = latency_budget_ms
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                import torch
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+                if RERANK_THREADS > 0:
+                    torch.set_num_threads(RERANK_THREADS)
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+                self._model = AutoModelForSequenceClassification.from_pretrained(self.model_id).eval()
+        return self._tokenizer, self._model
+
+    def score(self, query: str, documents: List[str]) -> List[Optional[float]]:
+        """Relevance score per document, or None for documents left unscored by the latency budget"""
+        import torch
+        tokenizer, model = self._load()
+        deadline = time.monotonic() + self.latency_budget_ms / 1000
+        scores: List[Optional[float]] = [None] * len(documents)
+
+        for start in range(0, len(documents), self.batch_size):
+            # Always score the first batch so the budget cannot disable reranking entirely
+            if start and time.monotonic() > deadline:
+                break
+            batch = documents[start:start + self.batch_size]
+            inputs = tokenizer([query] * len(batch), batch, padding=True, truncation=True, max_length=512, return_tensors="pt")
+            with torch.inference_mode():
+                logits = model(**inputs).logits
+            # Single-logit relevance models; multi-class heads use their last (relevant) class
+            batch_scores = logits[:, -1] if logits.shape[-1] > 1 else logits.squeeze(-1)
+            scores[start:start + len(batch)] = batch_scores.tolist()
+        return scores
+
+    def rerank_results(self, query: str, results: Dict[str, List[List[Any]]], top_n: Optional[int] = None) -> Dict[str, List[List[Any]]]:
+        """
+        Rerank a Chroma-shaped query result and keep the best top_n entries.
+
+        Scored candidates are ordered by score; any the budget left unscored
+        follow in their original retrieval order.
+        """
+        top_n = top_n or self.top_n
+        documents = results['documents'][0]
+        if not documents:
+            return results
+
+        scores = self.score(query, documents)
+        scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: scores[i], reverse=True)
+        order = (scored + [i for i, s in enumerate(scores) if s is None])[:top_n]
+
+        reranked = {
+            key: [[values[0][i] for i in order]]
+            for key, values in results.items()
+            if isinstance(values, list) and values and isinstance(values[0], list) and len(values[0]) == len(documents)
+        }
+        reranked['rerank_scores'] = [[scores[i] for i in order]]
+        return reranked
@@ -0,0 +1,185 @@
+"""
+Shared service registry.
+
+Every external client (Supabase, OpenAI, ChromaDB) and every processing
+service built on top of them is created lazily, once per process, and
+shared by all modules. The getters below double as FastAPI dependencies,
+and any service can be swapped for a local stand-in with
+registry.override, e.g. in tests.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
+from supabase import create_client, Client
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API")
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        """Return the shared instance of a service, creating it on first use"""
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                if name not in self._instances:
+                    self._instances[name] = self._factories[name]()
+                instance = self._instances[name]
+        return instance
+
+    def override(self, name: str, instance: Any) -> None:
+        """Replace a service with the given instance, e.g. a local stand-in for tests"""
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, name: str = None) -> None:
+        """Drop created instances so they are rebuilt on next use"""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+
+registry = ServiceRegistry()
+
+
+def _collection_name() -> str:
+    from .chroma_db import CHROMA_COLLECTION
+    # Chroma holds placeholder vectors with a vector store, which a full-vector collection would reject
+    return f"{CHROMA_COLLECTION}_int8" if get_vector_store() else CHROMA_COLLECTION
+
+def _create_keyword_index():
+    from .keyword_index import KeywordIndex, KEYWORD_INDEX_ENABLED, collection_index_path
+    return KeywordIndex(collection_index_path(_collection_name())) if KEYWORD_INDEX_ENABLED else False
+
+def _create_case_index():
+    from .case_index import CaseIndexCache, CASE_INDEX_ENABLED
+    return CaseIndexCache() if CASE_INDEX_ENABLED else False
+
+def _create_vector_store():
+    from .quantized_vectors import QuantizedVectorStore, VECTOR_STORE
+    if VECTOR_STORE not in ("chroma", "quantized"):
+        raise ValueError(f"Unknown VECTOR_STORE {VECTOR_STORE!r}; expected 'chroma' or 'quantized'")
+    return QuantizedVectorStore(dimension=get_embedding_backend().dimension) if VECTOR_STORE == "quantized" else False
+
+def _create_embedding_backend():
+    from .embedding_backends import create_embedding_backend
+    return create_embedding_backend()
+
+def _create_vector_db():
+    from .chroma_db import VectorDB
+    backend = get_embedding_backend()
+    return VectorDB(
+        keyword_index=get_keyword_index(),
+        embedding_model=backend.model,
+        dimension=backend.dimension,
+        case_index=get_case_index(),
+        vector_store=get_vector_store(),
+        collection_name=_collection_name()
+    )
+
+def _create_embedding_cache():
+    from .embedding_cache import EmbeddingCache, EMBED_CACHE_ENABLED
+    return EmbeddingCache() if EMBED_CACHE_ENABLED else False
+
+def _create_image_hash_cache():
+    from .image_hash_cache import ImageHashCache, IMAGE_HASH_CACHE_ENABLED
+    return ImageHashCache() if IMAGE_HASH_CACHE_ENABLED else False
+
+def _create_query_cache():
+    from .query_cache import QueryCache, QUERY_CACHE_ENABLED
+    return QueryCache() if QUERY_CACHE_ENABLED else False
+
+def _create_embeddings():
+    from .text_embedding import Embeddings
+    return Embeddings(backend=get_embedding_backend(), cache=get_embedding_cache(), query_cache=get_query_cache())
+
+def _create_reranker():
+    from .reranker import CrossEncoderReranker, RERANK_ENABLED
+    return CrossEncoderReranker() if RERANK_ENABLED else False
+
+def _create_audio():
+    from .audio_processing import Audio
+    return Audio()
+
+def _create_image_processing():
+    from .image_processing import ImageProcessing
+    return ImageProcessing()
+
+
+registry.register("supabase", lambda: create_client(SUPABASE_URL, SUPABASE_KEY))
+registry.register("openai", lambda: OpenAI(api_key=OPENAI_API_KEY))
+registry.register("async_openai", lambda: AsyncOpenAI(api_key=OPENAI_API_KEY))
+registry.register("keyword_index", _create_keyword_index)
+registry.register("case_index", _create_case_index)
+registry.register("vector_store", _create_vector_store)
+registry.register("embedding_backend", _create_embedding_backend)
+registry.register("vector_db", _create_vector_db)
+registry.register("embedding_cache", _create_embedding_cache)
+registry.register("image_hash_cache", _create_image_hash_cache)
+registry.register("query_cache", _create_query_cache)
+registry.register("embeddings", _create_embeddings)
+registry.register("reranker", _create_reranker)
+registry.register("audio", _create_audio)
+registry.register("image_processing", _create_image_processing)
+
+
+def get_supabase() -> Client:
+    return registry.get("supabase")
+
+def get_openai() -> OpenAI:
+    return registry.get("openai")
+
+def get_async_openai() -> AsyncOpenAI:
+    return registry.get("async_openai")
+
+def get_embedding_backend():
+    return registry.get("embedding_backend")
+
+def get_vector_db():
+    return registry.get("vector_db")
+
+def get_keyword_index():
+    return registry.get("keyword_index") or None
+
+def get_case_index():
+    return registry.get("case_index") or None
+
+def get_vector_store():
+    return registry.get("vector_store") or None
+
+def get_embedding_cache():
+    # Stored as False when disabled, since None means "not created yet"
+    return registry.get("embedding_cache") or None
+
+def get_image_hash_cache():
+    return registry.get("image_hash_cache") or None
+
+def get_query_cache():
+    return registry.get("query_cache") or None
+
+def get_embeddings():
+    return registry.get("embeddings")
+
+def get_reranker():
+    return registry.get("reranker") or None
+
+def get_audio():
+    return registry.get("audio")
+
+def get_image_processing():
+    return registry.get("image_processing")
@@ -1,23 +1,7 @@
-import os
 import json
 from typing import Dict, List
-from openai import OpenAI
-from .chroma_db import VectorDB
-from dotenv import load_dotenv
-from supabase import create_client, Client
-from .text_embedding import Embeddings
-
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API")
-client = OpenAI(api_key = OPENAI_API_KEY)
-
-vector_db = VectorDB()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-text_embedding = Embeddings()
+from .executor import run_blocking
+from .services import get_async_openai, get_supabase, get_vector_db, get_embeddings
 
 
 async def generate_tasks_with_ai(case_content: Dict[str, List[Dict]], case_id: str) -> List[Dict]:
@@ -78,7 +62,7 @@ Category must be: "safety", "compliance", "maintenance", "documentation", or "ge
 """
 
     # Call OpenAI with temperature for more consistent results
-    response = client.chat.completions.create(
+    response = await get_async_openai().chat.completions.create(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a construction site safety and compliance expert. You MUST respond with valid JSON only. No explanations, no markdown, just pure JSON."},
@@ -133,6 +117,9 @@ Category must be: "safety", "compliance", "maintenance", "documentation", or "ge
     
 async def store_tasks_in_supabase(tasks: List[Dict], case_id: str) -> List[Dict]:
     """Store generated tasks in Supabase AND ChromaDB"""
+    supabase = get_supabase()
+    vector_db = get_vector_db()
+    text_embedding = get_embeddings()
     
     # Prepare tasks for database
     db_tasks = []
@@ -149,27 +136,22 @@ async def store_tasks_in_supabase(tasks: List[Dict], case_id: str) -> List[Dict]
         db_tasks.append(db_task)
     
     # Insert into Supabase
-    result = supabase.table('tasks').insert(db_tasks).execute()
+    result = await run_blocking(supabase.table('tasks').insert(db_tasks).execute)
     
     # Now add tasks to ChromaDB for searchability
     task_ids = []
     task_texts = []
-    task_embeddings = []
     task_metadatas = []
     
     for i, task in enumerate(result.data):
         # Create searchable text from task
         task_text = f"Task: {task['title']}\nDescription: {task['description']}\nPriority: {task['priority']}\nCategory: {task['category']}\nReasoning: {task['ai_reasoning']}"
         
-        # Generate embedding
-        embedding = text_embedding.embed_text(task_text)
-        
         # Create unique ID for task in ChromaDB
         task_chromadb_id = f"{case_id}_task_{task['id'][:8]}"
         
         task_ids.append(task_chromadb_id)
         task_texts.append(task_text)
-        task_embeddings.append(embedding)
         
         # Metadata for the task
         metadata = {
@@ -184,7 +166,10 @@ async def store_tasks_in_supabase(tasks: List[Dict], case_id: str) -> List[Dict]
     
     # Store in ChromaDB
     if task_ids:
-        vector_db.collection.add(
+        # Embed all tasks in one batched request
+        task_embeddings = await run_blocking(text_embedding.embed_batch, task_texts)
+        await run_blocking(
+            vector_db.add,
             ids=task_ids,
             documents=task_texts,
             embeddings=task_embeddings,
@@ -1,35 +1,149 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
-from .chroma_db import VectorDB
-from typing import List, Dict, Any
+from .embedding_cache import EmbeddingCache
+from .embedding_backends import EmbeddingBackend, OpenAIEmbeddingBackend
+from .chroma_db import build_where
+from .keyword_index import reciprocal_rank_fusion
+from .services import get_openai, get_vector_db
+from typing import List, Dict, Any, Optional
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API")
 
-vector_db = VectorDB()
-client = OpenAI(api_key = OPENAI_API_KEY)
+# Chunks returned by a search when the caller does not ask for a number
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", 5))
+# "hybrid" fuses BM25 keyword and vector rankings; "vector" uses embeddings alone
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+# Candidates taken from each ranking before fusion, as a multiple of k
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", 4))
 
 class Embeddings:
-    def __init__(self):
-        pass
-    
+    def __init__(self, backend: Optional[EmbeddingBackend] = None, cache=None, query_cache=None):
+        self.backend = backend or OpenAIEmbeddingBackend()
+        self.cache = cache
+        self.query_cache = query_cache
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
     def embed_text(self, text):
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
-
-    def get_query(self, query: str) -> str:
-    # Create embedding using the SAME model as ingestion - cannot be different because of dimensions
-        query_embedding = self.embed_text(query)
-        results = vector_db.collection.query(
-            query_embeddings=[query_embedding],  # have to pass the embedding directly
-            n_results=5
-        )
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many texts with as few backend calls as possible.
+
+        Texts already in the embedding cache are served from it. The rest are
+        split into the sub-batches the backend accepts in one call (for
+        OpenAI, within the per-request input count and token limits), and the
+        returned embeddings are in the same order as the input texts.
+        """
+        keys = [EmbeddingCache.make_key(self.model, text) for text in texts]
+        cached = self.cache.get_many(keys) if self.cache else {}
+
+        # Only request each distinct uncached text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        missing_keys = list(missing)
+        missing_texts = list(missing.values())
+
+        fresh = {}
+        for batch in self.backend.batches(missing_texts):
+            batch_embeddings = self.backend.embed([missing_texts[i] for i in batch])
+            batch_results = {missing_keys[i]: embedding for i, embedding in zip(batch, batch_embeddings)}
+            if self.cache:
+                self.cache.put_many(batch_results)
+            fresh.update(batch_results)
+
+        return [cached[key] if key in cached else fresh[key] for key in keys]
+
+    def get_query(
+        self,
+        query: str,
+        case_id: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        filename: Optional[str] = None,
+        k: int = SEARCH_TOP_K,
+        mode: str = SEARCH_MODE
+    ) -> str:
+        """
+        Search the collection for the k chunks nearest to a query.
+
+        The optional case_id, doc_type and filename filters are applied by
+        Chroma as part of the vector query, so only matching chunks are ranked.
+        In hybrid mode the vector ranking is fused with a BM25 keyword ranking,
+        which finds exact identifiers (spec sections, RFI numbers, beam tags)
+        that embeddings miss. Hybrid falls back to vector search when no
+        keyword index is configured.
+        Results are cached per collection version, query, filters, k and mode,
+        and query embeddings are cached per query, when a query cache is set.
+        """
+        vector_db = get_vector_db()
+        where = build_where(case_id, doc_type, filename)
+        if not vector_db.keyword_index:
+            mode = "vector"
+        result_key = None
+        if self.query_cache:
+            result_key = self.query_cache.result_key(vector_db.version, query, where, k, mode)
+            cached = self.query_cache.get_result(result_key)
+            if cached is not None:
+                return cached
+
+        # Create embedding using the SAME model as ingestion - cannot be different because of dimensions
+        query_embedding = self.query_cache.get_embedding(self.model, query) if self.query_cache else None
+        if query_embedding is None:
+            query_embedding = self.embed_text(query)
+            if self.query_cache:
+                self.query_cache.put_embedding(self.model, query, query_embedding)
+
+        if mode == "hybrid":
+            results = self._hybrid_query(vector_db, query, query_embedding, where, k,
+                                         case_id=case_id, doc_type=doc_type, original_filename=filename)
+        else:
+            results = vector_db.query(
+                query_embeddings=[query_embedding],  # have to pass the embedding directly
+                n_results=k,
+                where=where
+            )
+        if result_key is not None:
+            self.query_cache.put_result(result_key, results)
         return results
         
+    def _hybrid_query(self, vector_db, query: str, query_embedding: List[float], where: Optional[Dict[str, Any]],
+                      k: int, **filters: Optional[str]) -> Dict[str, List[List[Any]]]:
+        """Fuse vector and BM25 rankings with reciprocal rank fusion, returned in Chroma's query result shape"""
+        candidates = k * HYBRID_CANDIDATE_FACTOR
+        vector_results = vector_db.query(
+            query_embeddings=[query_embedding],
+            n_results=candidates,
+            where=where
+        )
+        keyword_ids = vector_db.keyword_index.search(query, candidates, **filters)
+        fused = reciprocal_rank_fusion([vector_results['ids'][0], keyword_ids])
+
+        records = {
+            record_id: (document, metadata)
+            for record_id, document, metadata in zip(
+                vector_results['ids'][0], vector_results['documents'][0], vector_results['metadatas'][0]
+            )
+        }
+        # Chunks found only by keyword still need their text and metadata
+        missing = [record_id for record_id, _ in fused if record_id not in records]
+        if missing:
+            fetched = vector_db.get(ids=missing, case_id=filters.get("case_id"), include=["documents", "metadatas"])
+            records.update(zip(fetched['ids'], zip(fetched['documents'], fetched['metadatas'])))
+
+        # The keyword index may still hold IDs since deleted from the vector store; drop them before cutting to k
+        fused = [(record_id, score) for record_id, score in fused if record_id in records][:k]
+        return {
+            "ids": [[record_id for record_id, _ in fused]],
+            "documents": [[records[record_id][0] for record_id, _ in fused]],
+            "metadatas": [[records[record_id][1] for record_id, _ in fused]],
+            "scores": [[score for _, score in fused]]
+        }
+
     def llm_processing(self, query_result: List[Dict[str, Any]], user_question: str) -> str:
         documents, metadata = query_result
         context_parts = []
@@ -60,7 +174,7 @@ class Embeddings:
 
         Answer:"""
         
-        response = client.chat.completions.create(
+        response = get_openai().chat.completions.create(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": system_message},
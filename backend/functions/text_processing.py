@@ -1,28 +1,188 @@
+import os
+import re
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from docling.datamodel.base_models import InputFormat
 from docling.document_converter import DocumentConverter
 from docling.chunking import HybridChunker
 from docling_core.transforms.chunker.tokenizer.huggingface import HuggingFaceTokenizer
 from transformers import AutoTokenizer
+from .executor import run_blocking
 
-class TextProcessing:
-    EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
-    MAX_TOKENS = 300  # Further reduced to 300 to ensure we stay well under 512 limit
-    default_tokenizer = HuggingFaceTokenizer(tokenizer=AutoTokenizer.from_pretrained(EMBED_MODEL_ID),max_tokens=MAX_TOKENS) 
-    default_chunker = HybridChunker(tokenizer=default_tokenizer, merge_peers=False)  # Changed to False to prevent merging  
-    converter = DocumentConverter()
+# Number of Docling worker processes; 0 converts in the calling process instead
+DOCLING_POOL_SIZE = int(os.getenv("DOCLING_POOL_SIZE", max(1, (os.cpu_count() or 2) // 2)))
+# Recycle a worker after this many conversions to release leaked memory
+DOCLING_MAX_TASKS_PER_WORKER = int(os.getenv("DOCLING_MAX_TASKS_PER_WORKER", 20))
+
+EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_TOKENS = 300  # Further reduced to 300 to ensure we stay well under 512 limit
+
+
+def build_tokenizer() -> HuggingFaceTokenizer:
+    return HuggingFaceTokenizer(tokenizer=AutoTokenizer.from_pretrained(EMBED_MODEL_ID), max_tokens=MAX_TOKENS)
+
+def build_chunker(tokenizer: HuggingFaceTokenizer) -> HybridChunker:
+    return HybridChunker(tokenizer=tokenizer, merge_peers=False)  # Changed to False to prevent merging
+
+
+# Tokenizer for chunking text produced in this process (e.g. transcripts), loaded once
+_tokenizer: Optional[HuggingFaceTokenizer] = None
+_tokenizer_lock = threading.Lock()
+
+def get_tokenizer() -> HuggingFaceTokenizer:
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            _tokenizer = build_tokenizer()
+    return _tokenizer
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _split_to_budget(text: str, tokenizer: HuggingFaceTokenizer, max_tokens: int) -> List[str]:
+    """Split text into sentences, breaking any sentence over max_tokens on word boundaries"""
+    pieces = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if not sentence:
+            continue
+        if tokenizer.count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words, current = sentence.split(), []
+        for word in words:
+            if current and tokenizer.count_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+def chunk_transcript(segments: List[Dict], tokenizer: Optional[HuggingFaceTokenizer] = None, max_tokens: int = MAX_TOKENS) -> List[Dict]:
+    """
+    Chunk timestamped transcript segments to the same token budget used for PDFs.
+
+    Sentences are packed into chunks of at most max_tokens without crossing
+    segment boundaries. Each chunk gets start and end times (seconds),
+    interpolated from its character position within its segment.
+
+    Args:
+        segments: Dicts with start, end and text, in order
         
+    Returns:
+        Dicts with text, start and end, in order
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    chunks = []
+    for segment in segments:
+        pieces = _split_to_budget(segment["text"], tokenizer, max_tokens)
+        seconds_per_char = (segment["end"] - segment["start"]) / (sum(len(piece) for piece in pieces) or 1)
+
+        # Pack sentences into groups, remembering the character span of each group
+        groups, current, start_char, position = [], [], 0, 0
+        for piece in pieces:
+            if current and tokenizer.count_tokens(" ".join(current + [piece])) > max_tokens:
+                groups.append((current, start_char, position))
+                current, start_char = [], position
+            current.append(piece)
+            position += len(piece)
+        if current:
+            groups.append((current, start_char, position))
+
+        for group, first_char, last_char in groups:
+            chunks.append({
+                "text": " ".join(group),
+                "start": round(segment["start"] + first_char * seconds_per_char, 2),
+                "end": round(segment["start"] + last_char * seconds_per_char, 2)
+            })
+    return chunks
+
+
+# Per-process converter and chunker, created once and reused for every conversion
+_converter: Optional[DocumentConverter] = None
+_chunker: Optional[HybridChunker] = None
+_models_lock = threading.Lock()
+
+def _load_models():
+    global _converter, _chunker
+    with _models_lock:
+        if _converter is None:
+            _chunker = build_chunker(build_tokenizer())
+            _converter = DocumentConverter()
+            # Load the layout and OCR models now rather than on the first document
+            _converter.initialize_pipeline(InputFormat.PDF)
+    return _converter, _chunker
+
+def _convert_to_chunks(file_path: str) -> List[str]:
+    converter, chunker = _load_models()
+    doc = converter.convert(file_path).document
+    return [c.text for c in chunker.chunk(dl_doc=doc)]
+
+def _convert_to_text(file_path: str) -> str:
+    converter, _ = _load_models()
+    return converter.convert(file_path).document.export_to_text()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_docling_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared pool of warm Docling workers, starting it on first use"""
+    global _pool
+    if DOCLING_POOL_SIZE <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=DOCLING_POOL_SIZE,
+                # max_tasks_per_child needs a non-fork start method
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_models,
+                max_tasks_per_child=DOCLING_MAX_TASKS_PER_WORKER
+            )
+    return _pool
+
+def shutdown_docling_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class TextProcessing:
+    EMBED_MODEL_ID = EMBED_MODEL_ID
+    MAX_TOKENS = MAX_TOKENS
+
     def __init__(self, file_path, tokenizer=None, chunker=None):
         self.file_path = file_path
-        self.tokenizer = tokenizer or self.default_tokenizer
-        self.chunker  = chunker or self.default_chunker
-    
+        self.tokenizer = tokenizer
+        self.chunker = chunker or (build_chunker(tokenizer) if tokenizer else None)
+
     def pdf_to_text(self):
-        source = self.file_path
-        converter = self.converter
-        result = converter.convert(source)
-        return result.document.export_to_text()
+        pool = get_docling_pool()
+        if pool is None:
+            return _convert_to_text(self.file_path)
+        return pool.submit(_convert_to_text, self.file_path).result()
 
     def pdf_to_chunks(self):
-        doc = self.converter.convert(self.file_path).document
-        chunk_iter = self.chunker.chunk(dl_doc=doc)
-        chunks = list(chunk_iter)
-        return [c.text for c in chunks]
+        if self.chunker is not None:
+            # A custom chunker cannot be shipped to the pool workers
+            converter, _ = _load_models()
+            doc = converter.convert(self.file_path).document
+            return [c.text for c in self.chunker.chunk(dl_doc=doc)]
+
+        pool = get_docling_pool()
+        if pool is None:
+            return _convert_to_chunks(self.file_path)
+        return pool.submit(_convert_to_chunks, self.file_path).result()
+
+    async def pdf_to_chunks_async(self):
+        """Like pdf_to_chunks, but awaits the pool worker instead of blocking a thread on it"""
+        pool = get_docling_pool()
+        if pool is None or self.chunker is not None:
+            return await run_blocking(self.pdf_to_chunks)
+        return await asyncio.wrap_future(pool.submit(_convert_to_chunks, self.file_path))
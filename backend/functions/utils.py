@@ -1,40 +1,116 @@
-import os, uuid, json, tempfile
-from typing import List, Tuple, Any, Dict
+import os, uuid, json, tempfile, hashlib, asyncio
+from typing import List, Tuple, Any, Dict, Optional, Iterator, Callable, Awaitable
 from pathlib import Path
 from fastapi import  UploadFile
-from .text_processing import TextProcessing
-from .text_embedding import Embeddings
-from .chroma_db import VectorDB
-from .audio_processing import Audio
-from .image_processing import ImageProcessing
-from .database import upload_file_to_supabase, delete_case_from_supabase
+from .text_processing import TextProcessing, chunk_transcript
+from .audio_processing import AUDIO_PREPROCESS
+from .database import store_file_in_supabase, save_file_metadata, update_file_processing_status, delete_case_from_supabase, ensure_content_stored, find_processed_content
+from .executor import run_blocking
+from .pipeline import stream_embed_upsert
+from .image_processing import dhash
+from .services import get_embeddings, get_vector_db, get_audio, get_image_processing, get_image_hash_cache
 
 CHUNK_DIR = Path("uploads/chunks")
 CHUNK_DIR.mkdir(parents=True, exist_ok=True)
 
-text_embedding = Embeddings()
-vector_db = VectorDB()
-audio_process = Audio()
-image_process = ImageProcessing()
-
 def create_case_id() -> str:
     """Generate a unique case ID that will be shared across all related files"""
     return f"case_{uuid.uuid4().hex[:12]}"
 
-async def save_uploaded_file_to_temp(upload_file: UploadFile) -> Path:
+async def save_uploaded_file_to_temp(upload_file: UploadFile, directory: Optional[Path] = None) -> Tuple[Path, str]:
+    """Stream an upload to a temp file, returning its path and the SHA-256 of its content"""
     # Reset file pointer to beginning
     await upload_file.seek(0)
     
     suffix = Path(upload_file.filename).suffix or ".pdf"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+    content_hash = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tmp:
         tmp_path = Path(tmp.name)
-        # Stream copy upload to temp
+        # Stream copy upload to temp, hashing as we go
         while True:
             chunk = await upload_file.read(1024 * 1024)
             if not chunk: 
                 break
             tmp.write(chunk)
-    return tmp_path
+            content_hash.update(chunk)
+    return tmp_path, content_hash.hexdigest()
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of a file's content, read in blocks"""
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+async def delete_upload_vectors(case_id: str, upload_id: str) -> None:
+    """Remove every vector stored by one upload"""
+    await run_blocking(get_vector_db().delete, where={"upload_id": upload_id}, case_id=case_id)
+
+async def process_alongside_upload(
+    file_path: str,
+    case_id: str,
+    file_type: str,
+    original_filename: str,
+    content_hash: str,
+    upload_id: str,
+    processing: Awaitable[Tuple[Any, List[str]]]
+) -> Tuple[Dict[str, Any], Any]:
+    """
+    Upload a file to Supabase storage while it is being processed.
+    
+    The storage upload and the processing coroutine run concurrently. The
+    files row is inserted with status processing as soon as the upload is
+    stored, and set to completed or failed once processing finishes; on
+    success its id is written onto the vectors the processing stored, after
+    checking that shared content was not removed meanwhile. If any step
+    fails, every vector tagged with this upload_id is removed.
+    
+    Args:
+        upload_id: Value of the upload_id metadata on this upload's vectors
+        processing: Coroutine returning (result, ids of the vectors it stored)
+        
+    Returns:
+        Tuple of (files row, processing result)
+    """
+    async def store_and_record():
+        stored_file = await store_file_in_supabase(file_path, case_id, file_type, original_filename, content_hash)
+        return await save_file_metadata(case_id, file_type, original_filename, stored_file, processing_status="processing")
+    
+    supabase_file, processed = await asyncio.gather(store_and_record(), processing, return_exceptions=True)
+    vector_db = get_vector_db()
+    
+    if isinstance(supabase_file, BaseException) or isinstance(processed, BaseException):
+        # Processing may have stored part of its vectors before failing
+        await delete_upload_vectors(case_id, upload_id)
+        if isinstance(supabase_file, BaseException):
+            raise supabase_file
+        await update_file_processing_status(supabase_file['id'], "failed")
+        raise processed
+    
+    # A case deletion may have removed shared content this upload skipped storing
+    try:
+        await ensure_content_stored(file_path, supabase_file)
+    except Exception:
+        await delete_upload_vectors(case_id, upload_id)
+        await update_file_processing_status(supabase_file['id'], "failed")
+        raise
+    
+    # Link the stored vectors to the files row, now that it exists
+    result, ids = processed
+    batch_size = await run_blocking(vector_db.max_batch_size)
+    for start in range(0, len(ids), batch_size):
+        part = ids[start:start + batch_size]
+        await run_blocking(
+            vector_db.update,
+            ids=part,
+            case_id=case_id,
+            metadatas=[{'supabase_file_id': supabase_file['id']} for _ in part]
+        )
+    
+    await update_file_processing_status(supabase_file['id'], "completed")
+    supabase_file['processing_status'] = "completed"
+    return supabase_file, result
 
 def process_chunks_for_storage(chunks: List[Any], doc_id: str, filename: str) -> Tuple[List[str], List[str], List[List[float]], List[Dict[str, Any]]]:
     """
@@ -50,7 +126,6 @@ def process_chunks_for_storage(chunks: List[Any], doc_id: str, filename: str) ->
     """
     chunk_ids = []
     chunk_texts = []
-    chunk_embeddings = []
     chunk_metadatas = []
     
     for i, chunk in enumerate(chunks):
@@ -60,13 +135,9 @@ def process_chunks_for_storage(chunks: List[Any], doc_id: str, filename: str) ->
         else:
             chunk_text = str(chunk)
         
-        # Generate embedding
-        embedding = text_embedding.embed_text(chunk_text)
-        
         # Prepare data for ChromaDB
         chunk_ids.append(f"{doc_id}_chunk_{i}")
         chunk_texts.append(chunk_text)
-        chunk_embeddings.append(embedding)
         
         # Create metadata for this chunk
         metadata = {
@@ -84,45 +155,124 @@ def process_chunks_for_storage(chunks: List[Any], doc_id: str, filename: str) ->
         
         chunk_metadatas.append(metadata)
     
+    # Generate embeddings for all chunks in as few requests as possible
+    chunk_embeddings = get_embeddings().embed_batch(chunk_texts)
+    
     return chunk_ids, chunk_texts, chunk_embeddings, chunk_metadatas
 
-async def process_audio_for_case(file_path: str, case_id: str, audio_filename: str) -> Dict[str, Any]:
-    """Process audio file and store in ChromaDB with case ID."""
-    
-    # Upload raw audio to Supabase FIRST
-    supabase_file = await upload_file_to_supabase(
-        file_path=file_path,
-        case_id=case_id,
-        file_type="audio",
-        original_filename=audio_filename
-    )
+async def reuse_processed_content(content_hash: str, metadata: Dict[str, Any], make_id: Callable[[int], str]) -> Optional[List[str]]:
+    """
+    Copy the vectors of an earlier upload with identical content into this upload.
     
-    # Process audio
-    speech_conversion = audio_process.speech_to_text(file_path)
-    cleaned_audio = audio_process.clean_audio(speech_conversion)
+    Records derived from the same bytes (same content_hash and doc_type) are
+    re-added under new ids with their text and embeddings unchanged and their
+    metadata rewritten for this upload, so Docling, Whisper, vision and
+    embedding calls are skipped. Only a completed upload is copied: earlier
+    uploads are found through their completed files rows, and only the
+    records carrying that row's supabase_file_id are read, from the shard of
+    its case.
     
-    # Generate embedding
-    embedding = text_embedding.embed_text(cleaned_audio)
+    Args:
+        content_hash: SHA-256 of the uploaded file
+        metadata: Metadata for this upload; overrides the copied records' metadata
+        make_id: Builds the new record ID from a chunk index
+        
+    Returns:
+        The reused texts in chunk order, or None if the content is new
+    """
+    vector_db = get_vector_db()
+    
+    # Copy from one earlier upload holding every one of its chunks exactly once
+    records = None
+    for supabase_file in await find_processed_content(content_hash, metadata['original_filename']):
+        existing = await run_blocking(
+            vector_db.get,
+            case_id=supabase_file['case_id'],
+            where={"$and": [
+                {"case_id": supabase_file['case_id']},
+                {"supabase_file_id": supabase_file['id']},
+                {"doc_type": metadata['doc_type']}
+            ]},
+            include=["documents", "embeddings", "metadatas"]
+        )
+        group = list(zip(existing['metadatas'], existing['documents'], existing['embeddings']))
+        chunk_indices = {meta.get('chunk_index', 0) for meta, _, _ in group}
+        if group and len(chunk_indices) == len(group) == group[0][0].get('total_chunks', len(group)):
+            records = sorted(group, key=lambda record: record[0].get('chunk_index', 0))
+            break
+    if records is None:
+        return None
+    
+    ids = [make_id(meta.get('chunk_index', 0)) for meta, _, _ in records]
+    documents = [doc for _, doc, _ in records]
+    embeddings = [embedding for _, _, embedding in records]
+    # The copies belong to this upload, so they are linked to its own files row later
+    metadatas = [{**{k: v for k, v in meta.items() if k != 'supabase_file_id'}, **metadata} for meta, _, _ in records]
+    
+    batch_size = await run_blocking(vector_db.max_batch_size)
+    for start in range(0, len(ids), batch_size):
+        await run_blocking(
+            vector_db.add,
+            ids=ids[start:start + batch_size],
+            documents=documents[start:start + batch_size],
+            embeddings=embeddings[start:start + batch_size],
+            metadatas=metadatas[start:start + batch_size]
+        )
+    
+    return documents
+
+async def process_audio_for_case(file_path: str, case_id: str, audio_filename: str, content_hash: Optional[str] = None,
+                                 upload_id: Optional[str] = None) -> Dict[str, Any]:
+    """Process audio file and store in ChromaDB with case ID, uploading the raw audio to Supabase meanwhile."""
+    content_hash = content_hash or await run_blocking(hash_file, file_path)
+    upload_id = upload_id or uuid.uuid4().hex
     
-    # Create unique ID for this audio chunk
-    audio_id = f"{case_id}_audio_{uuid.uuid4().hex[:8]}"
+    # Prefix for the IDs of this recording's transcript chunks
+    audio_id = f"{case_id}_audio_{upload_id[:8]}"
     
-    # Prepare metadata
+    # Prepare metadata; supabase_file_id is added once the upload is recorded
     metadata = {
         'case_id': case_id,
         'doc_type': 'audio_transcription',
         'original_filename': audio_filename,
-        'supabase_file_id': supabase_file['id'],
-        'chunk_index': 0,
-        'total_chunks': 1
+        'content_hash': content_hash,
+        'upload_id': upload_id
     }
     
-    # Store in ChromaDB
-    vector_db.collection.add(
-        ids=[audio_id],
-        documents=[cleaned_audio],
-        embeddings=[embedding],
-        metadatas=[metadata]
+    async def transcribe():
+        # Reuse the transcript if this exact recording was processed before
+        reused = await reuse_processed_content(content_hash, metadata, lambda i: f"{audio_id}_chunk_{i}")
+        if reused:
+            ids = [f"{audio_id}_chunk_{i}" for i in range(len(reused))]
+            return ("\n\n".join(reused), len(reused), True, None), ids
+        
+        # Long recordings are split on silence; segments are transcribed and cleaned concurrently
+        audio_process = get_audio()
+        segments, preprocessing = await audio_process.transcribe_segments(file_path, preprocess=AUDIO_PREPROCESS)
+        segments = await audio_process.clean_segments(segments)
+        cleaned_audio = "\n\n".join(segment['text'] for segment in segments if segment['text'])
+        
+        # Chunk to the same token budget as documents, so a search hits the
+        # relevant minute of the recording rather than the whole file
+        chunks = await run_blocking(chunk_transcript, segments)
+        records = [
+            (
+                f"{audio_id}_chunk_{i}",
+                chunk['text'],
+                {**metadata, 'chunk_index': i, 'total_chunks': len(chunks), 'start_time': chunk['start'], 'end_time': chunk['end']}
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+        await stream_embed_upsert(
+            records,
+            embed_batch=get_embeddings().embed_batch,
+            upsert=get_vector_db().add,
+            max_upsert_size=await run_blocking(get_vector_db().max_batch_size)
+        )
+        return (cleaned_audio, len(chunks), False, preprocessing or None), [record[0] for record in records]
+    
+    supabase_file, (cleaned_audio, num_chunks, deduplicated, preprocessing) = await process_alongside_upload(
+        file_path, case_id, "audio", audio_filename, content_hash, upload_id, transcribe()
     )
     
     return {
@@ -131,46 +281,73 @@ async def process_audio_for_case(file_path: str, case_id: str, audio_filename: s
         "supabase_file_id": supabase_file['id'],
         "storage_url": supabase_file['file_url'],
         "transcription_length": len(cleaned_audio),
-        "doc_type": "audio_transcription"
+        "num_chunks": num_chunks,
+        "doc_type": "audio_transcription",
+        "deduplicated": deduplicated,
+        "preprocessing": preprocessing
     }
 
 
-async def process_image_for_case(file_path: str, case_id: str, image_filename: str) -> Dict[str, Any]:
-    """Process image file and store in ChromaDB with case ID."""
-    
-    # Upload raw image to Supabase FIRST
-    supabase_file = await upload_file_to_supabase(
-        file_path=file_path,
-        case_id=case_id,
-        file_type="image",
-        original_filename=image_filename
-    )
-    
-    # Process image
-    image_to_text = image_process.image_description(file_path)
-    
-    # Generate embedding
-    embedding = text_embedding.embed_text(image_to_text)
+async def process_image_for_case(file_path: str, case_id: str, image_filename: str, content_hash: Optional[str] = None,
+                                 upload_id: Optional[str] = None) -> Dict[str, Any]:
+    """Process image file and store in ChromaDB with case ID, uploading the raw image to Supabase meanwhile."""
+    content_hash = content_hash or await run_blocking(hash_file, file_path)
+    upload_id = upload_id or uuid.uuid4().hex
     
     # Create unique ID for this image chunk
-    image_id = f"{case_id}_image_{uuid.uuid4().hex[:8]}"
+    image_id = f"{case_id}_image_{upload_id[:8]}"
     
-    # Prepare metadata
+    # Prepare metadata; supabase_file_id is added once the upload is recorded
     metadata = {
         'case_id': case_id,
         'doc_type': 'image',
         'original_filename': image_filename,
-        'supabase_file_id': supabase_file['id'],
-        'chunk_index': 0,
-        'total_chunks': 1
+        'content_hash': content_hash,
+        'upload_id': upload_id
     }
     
-    # Store in ChromaDB
-    vector_db.collection.add(
-        ids=[image_id],
-        documents=[image_to_text],
-        embeddings=[embedding],
-        metadatas=[metadata]
+    async def describe():
+        # Reuse the description if this exact image was processed before
+        reused = await reuse_processed_content(content_hash, metadata, lambda i: image_id)
+        if reused:
+            return (reused[0], True, False), [image_id]
+        
+        # Near-duplicate shots of the same scene reuse an earlier description and embedding
+        image_cache = get_image_hash_cache()
+        embeddings = get_embeddings()
+        image_hash, cached = None, None
+        if image_cache:
+            try:
+                image_hash = await run_blocking(dhash, file_path)
+                cached = await run_blocking(image_cache.find, image_hash, embeddings.model)
+            except Exception as e:
+                print(f"Could not hash image {image_filename}: {e}")
+        
+        if cached:
+            image_to_text, embedding, _ = cached
+        else:
+            # Process image; images arriving together are described in shared batched requests
+            image_to_text = await get_image_processing().describe(file_path)
+            embedding = None
+        
+        if embedding is None:
+            # New images, and cached ones embedded by a different model
+            embedding = await run_blocking(embeddings.embed_text, image_to_text)
+            if image_hash is not None:
+                await run_blocking(image_cache.add, image_hash, image_to_text, embedding, embeddings.model)
+        
+        # Store in ChromaDB
+        await run_blocking(
+            get_vector_db().add,
+            ids=[image_id],
+            documents=[image_to_text],
+            embeddings=[embedding],
+            metadatas=[{**metadata, 'chunk_index': 0, 'total_chunks': 1}]
+        )
+        return (image_to_text, False, cached is not None), [image_id]
+    
+    supabase_file, (image_to_text, deduplicated, near_duplicate) = await process_alongside_upload(
+        file_path, case_id, "image", image_filename, content_hash, upload_id, describe()
     )
     
     return {
@@ -179,7 +356,9 @@ async def process_image_for_case(file_path: str, case_id: str, image_filename: s
         "supabase_file_id": supabase_file['id'],
         "storage_url": supabase_file['file_url'],
         "description_length": len(image_to_text),
-        "doc_type": "image"
+        "doc_type": "image",
+        "deduplicated": deduplicated,
+        "near_duplicate": near_duplicate
     }
 
 
@@ -201,6 +380,29 @@ def save_chunks_to_jsonl(chunks: List[Any], doc_id: str) -> Path:
     return out_path
 
 
+def iter_chunk_records(chunks: List[Any], doc_id: str, metadata: Dict[str, Any], out_path: Path) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Yield (id, text, metadata) records for a document's chunks, lazily.
+    
+    Each chunk is also appended to the JSONL backup at out_path as it is read.
+    
+    Args:
+        chunks: List of chunks (can be dicts or strings)
+        doc_id: Document ID
+        metadata: Metadata shared by every chunk of the document
+        out_path: Path of the JSONL backup file
+    """
+    with out_path.open("w", encoding="utf-8") as f:
+        for i, chunk in enumerate(chunks):
+            chunk_text = chunk if isinstance(chunk, str) else chunk.get('text', str(chunk))
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            
+            chunk_metadata = dict(metadata)
+            chunk_metadata['chunk_index'] = i
+            chunk_metadata['total_chunks'] = len(chunks)
+            yield f"{doc_id}_chunk_{i}", chunk_text, chunk_metadata
+
+
 def cleanup_temp_file(file_path: Path) -> None:
     """
     Safely remove temporary file.
@@ -213,73 +415,68 @@ def cleanup_temp_file(file_path: Path) -> None:
     except OSError:
         pass  # File might already be deleted or inaccessible
 
+async def process_document_for_case(file_path: str, case_id: str, document_filename: str, content_hash: Optional[str] = None,
+                                    upload_id: Optional[str] = None) -> Dict[str, Any]:
+    """Process document file and store in ChromaDB with case ID, uploading the raw file to Supabase meanwhile."""
+    content_hash = content_hash or await run_blocking(hash_file, file_path)
+    
+    doc_id = upload_id or uuid.uuid4().hex
+    # supabase_file_id is added once the upload is recorded
+    metadata = {
+        'case_id': case_id,
+        'doc_id': doc_id,
+        'doc_type': 'document',
+        'original_filename': document_filename,
+        'content_hash': content_hash,
+        'upload_id': doc_id
+    }
+    out_path = CHUNK_DIR / f"{doc_id}.jsonl"
+    
+    async def chunk_and_embed():
+        # Reuse chunks and embeddings if this exact document was processed before
+        chunks = await reuse_processed_content(content_hash, metadata, lambda i: f"{doc_id}_chunk_{i}")
+        deduplicated = chunks is not None
+        if deduplicated:
+            await run_blocking(save_chunks_to_jsonl, chunks, doc_id)
+        else:
+            # Then process for ChromaDB
+            tp = TextProcessing(file_path)
+            chunks = await tp.pdf_to_chunks_async()
+            
+            # Stream chunks through batched embedding and ChromaDB upsert so only a
+            # few batches of vectors are in memory at once; the JSONL backup is
+            # written as the chunks are read
+            await stream_embed_upsert(
+                iter_chunk_records(chunks, doc_id, metadata, out_path),
+                embed_batch=get_embeddings().embed_batch,
+                upsert=get_vector_db().add,
+                max_upsert_size=await run_blocking(get_vector_db().max_batch_size)
+            )
+        return (len(chunks), deduplicated), [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
+    
+    supabase_file, (num_chunks, deduplicated) = await process_alongside_upload(
+        file_path, case_id, "document", document_filename, content_hash, doc_id, chunk_and_embed()
+    )
+    
+    return {
+        "case_id": case_id,
+        "original_filename": document_filename,
+        "doc_id": doc_id,
+        "supabase_file_id": supabase_file['id'],
+        "storage_url": supabase_file['file_url'],
+        "chunks_path": str(out_path),
+        "num_chunks": num_chunks,
+        "doc_type": "document",
+        "deduplicated": deduplicated
+    }
+
 async def process_single_file_with_case(upload_file: UploadFile, case_id: str) -> Dict[str, Any]:
     """Process a single uploaded file with a specific case ID."""
 
-    tmp_path = await save_uploaded_file_to_temp(upload_file)
+    tmp_path, content_hash = await save_uploaded_file_to_temp(upload_file)
     
     try:
-        # Upload raw file to Supabase FIRST
-        supabase_file = await upload_file_to_supabase(
-            file_path=str(tmp_path),
-            case_id=case_id,
-            file_type="document",
-            original_filename=upload_file.filename
-        )
-        
-        # Then process for ChromaDB
-        doc_id = uuid.uuid4().hex
-        tp = TextProcessing(str(tmp_path))
-        chunks = tp.pdf_to_chunks()
-        
-        # Process chunks for ChromaDB
-        chunk_ids = []
-        chunk_texts = []
-        chunk_embeddings = []
-        chunk_metadatas = []
-        
-        for i, chunk in enumerate(chunks):
-            chunk_text = chunk if isinstance(chunk, str) else chunk.get('text', str(chunk))
-            embedding = text_embedding.embed_text(chunk_text)
-            
-            chunk_ids.append(f"{doc_id}_chunk_{i}")
-            chunk_texts.append(chunk_text)
-            chunk_embeddings.append(embedding)
-            
-            metadata = {
-                'case_id': case_id,
-                'doc_id': doc_id,
-                'doc_type': 'document',
-                'original_filename': upload_file.filename,
-                'supabase_file_id': supabase_file['id'],  # Link to Supabase
-                'chunk_index': i,
-                'total_chunks': len(chunks)
-            }
-            
-            chunk_metadatas.append(metadata)
-        
-        # Store in ChromaDB
-        vector_db.collection.add(
-            ids=chunk_ids,
-            documents=chunk_texts,
-            embeddings=chunk_embeddings,
-            metadatas=chunk_metadatas
-        )
-        
-        # Save chunks to JSONL
-        out_path = save_chunks_to_jsonl(chunks, doc_id)
-        
-        return {
-            "case_id": case_id,
-            "original_filename": upload_file.filename,
-            "doc_id": doc_id,
-            "supabase_file_id": supabase_file['id'],
-            "storage_url": supabase_file['file_url'],
-            "chunks_path": str(out_path),
-            "num_chunks": len(chunks),
-            "doc_type": "document"
-        }
-        
+        return await process_document_for_case(str(tmp_path), case_id, upload_file.filename, content_hash)
     finally:
         cleanup_temp_file(tmp_path)
 
@@ -291,7 +488,8 @@ def vectordb_output_processing(query_result):
 async def get_case_content_from_chromadb(case_id: str) -> Dict[str, List[Dict]]:
     """Retrieve all content for a case from ChromaDB"""
     
-    results = vector_db.collection.get(
+    results = await run_blocking(
+        get_vector_db().get,
         where={"case_id": case_id},
         include=["documents", "metadatas"]
     )
@@ -326,7 +524,7 @@ async def delete_case_completely(case_id: str) -> bool:
     """Delete a case and all its data from both ChromaDB and Supabase"""
     try:
         # Delete from ChromaDB first
-        chromadb_success = vector_db.delete_case_from_chromadb(case_id)
+        chromadb_success = await run_blocking(get_vector_db().delete_case_from_chromadb, case_id)
         
         # Delete from Supabase (includes files and metadata)
         supabase_success = await delete_case_from_supabase(case_id)
@@ -1,15 +1,58 @@
 import os
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from .functions.text_embedding import Embeddings
-from .functions.audio_processing import Audio
-from .functions.image_processing import ImageProcessing
-from .functions.chroma_db import VectorDB
+from .functions.text_processing import shutdown_docling_pool
+from .functions.executor import run_blocking
+from .functions.services import get_embedding_cache, get_image_hash_cache, get_query_cache, get_case_index, get_vector_store, get_vector_db
 
 # Import routers
 from .routers import cases_list, case_detail, case_upload, chat_interface
 
-app = FastAPI()
+async def migrate_to_vector_store():
+    """
+    Copy the existing collection into the vector store the first time
+    VECTOR_STORE=quantized is used. Serving would otherwise show every
+    existing case as empty, so a failure stops the app from starting.
+    """
+    vector_db = await run_blocking(get_vector_db)
+    copied = await run_blocking(vector_db.migrate_to_vector_store)
+    if copied:
+        print(f"Copied {copied} records into the vector store")
+
+async def backfill_keyword_index():
+    """Index records stored before the keyword index existed, before any ingest writes to it"""
+    try:
+        vector_db = await run_blocking(get_vector_db)
+        await run_blocking(vector_db.ensure_keyword_index)
+    except Exception as e:
+        print(f"Could not backfill the keyword index: {e}")
+
+async def reshard_vector_store():
+    """Move records stored before sharding was enabled into their shards"""
+    try:
+        vector_db = await run_blocking(get_vector_db)
+        moved = await run_blocking(vector_db.reshard)
+        if moved:
+            print(f"Moved {moved} records into per-case shards")
+    except Exception as e:
+        print(f"Could not move records into shards: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await migrate_to_vector_store()
+    await backfill_keyword_index()
+    # Run background ingestion workers for the lifetime of the app
+    await case_upload.job_queue.start()
+    # Case reads check the base collection until this finishes, so it need not hold up startup
+    preparation = asyncio.create_task(reshard_vector_store())
+    yield
+    preparation.cancel()
+    await case_upload.job_queue.stop()
+    shutdown_docling_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -25,17 +68,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize shared services
-vector_db = VectorDB()
-text_embedding = Embeddings()
-audio_process = Audio()
-image_process = ImageProcessing()
-
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "message": "Backend is running"}
 
+@app.get("/stats/cache")
+async def cache_stats(
+    embedding_cache = Depends(get_embedding_cache),
+    image_hash_cache = Depends(get_image_hash_cache),
+    query_cache = Depends(get_query_cache),
+    case_index = Depends(get_case_index),
+    vector_store = Depends(get_vector_store)
+):
+    """Hit/miss counters for the local caches"""
+    return {
+        "embeddings": embedding_cache.stats() if embedding_cache else None,
+        "image_hashes": image_hash_cache.stats() if image_hash_cache else None,
+        "queries": query_cache.stats() if query_cache else None,
+        "case_indexes": case_index.stats() if case_index else None,
+        "vector_store": vector_store.stats() if vector_store else None
+    }
+
 # Include routers
 app.include_router(cases_list.router)
 app.include_router(case_detail.router)
@@ -2,32 +2,28 @@
 Router for case detail functionality.
 Handles endpoints related to viewing case details and serving media files.
 """
-import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import RedirectResponse, Response
-from supabase import create_client, Client
+from supabase import Client
 from ..functions.utils import get_case_content_from_chromadb
+from ..functions.executor import run_blocking
+from ..functions.services import get_supabase
 
 router = APIRouter(tags=["case_detail"])
 
-# Initialize Supabase client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 @router.get("/case/{case_id}")
-async def get_case_details(case_id: str):
+async def get_case_details(case_id: str, supabase: Client = Depends(get_supabase)):
     """Get comprehensive case details with all files, content, and tasks"""
     try:
         # Get case info
-        case = supabase.table('cases').select("*").eq('id', case_id).single().execute()
+        case = await run_blocking(supabase.table('cases').select("*").eq('id', case_id).single().execute)
         if not case.data:
             raise HTTPException(status_code=404, detail="Case not found")
         
         # Get all files for this case
-        files = supabase.table('files').select("*").eq('case_id', case_id).execute()
+        files = await run_blocking(supabase.table('files').select("*").eq('case_id', case_id).execute)
         # Get all tasks for this case
-        tasks = supabase.table('tasks').select("*").eq('case_id', case_id).order('priority').execute()
+        tasks = await run_blocking(supabase.table('tasks').select("*").eq('case_id', case_id).order('priority').execute)
         
         # Get document content from ChromaDB for this case
         case_content = await get_case_content_from_chromadb(case_id)
@@ -110,11 +106,11 @@ async def get_case_details(case_id: str):
         raise HTTPException(status_code=500, detail=f"Error retrieving case details: {str(e)}")
 
 @router.get("/audio/{file_id}")
-async def serve_audio(file_id: str):
+async def serve_audio(file_id: str, supabase: Client = Depends(get_supabase)):
     """Serve audio file from Supabase storage"""
     try:
         # Get file info from Supabase
-        file_record = supabase.table('files').select("*").eq('id', file_id).single().execute()        
+        file_record = await run_blocking(supabase.table('files').select("*").eq('id', file_id).single().execute)        
         if not file_record.data:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -126,14 +122,14 @@ async def serve_audio(file_id: str):
         # Get a signed URL from Supabase storage
         try:
             # Create a signed URL that expires in 24 hours
-            signed_url_response = supabase.storage.from_('construction_files').create_signed_url(storage_path, 86400)
+            signed_url_response = await run_blocking(supabase.storage.from_('construction_files').create_signed_url, storage_path, 86400)
             signed_url = signed_url_response.get('signedURL')
             
             if signed_url:
                 return RedirectResponse(url=signed_url)
             else:
                 # Fallback to direct download
-                file_data = supabase.storage.from_('construction_files').download(storage_path)                
+                file_data = await run_blocking(supabase.storage.from_('construction_files').download, storage_path)                
                 return Response(
                     content=file_data,
                     media_type=mime_type,
@@ -151,11 +147,11 @@ async def serve_audio(file_id: str):
         raise HTTPException(status_code=500, detail=f"Error serving audio: {str(e)}")
 
 @router.get("/image/{file_id}")
-async def serve_image(file_id: str):
+async def serve_image(file_id: str, supabase: Client = Depends(get_supabase)):
     """Serve image file from Supabase storage"""
     try:        
         # Get file info from Supabase
-        file_record = supabase.table('files').select("*").eq('id', file_id).single().execute()        
+        file_record = await run_blocking(supabase.table('files').select("*").eq('id', file_id).single().execute)        
         if not file_record.data:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -168,14 +164,14 @@ async def serve_image(file_id: str):
         # Get a signed URL from Supabase storage
         try:
             # Create a signed URL that expires in 24 hours
-            signed_url_response = supabase.storage.from_('construction_files').create_signed_url(storage_path, 86400)
+            signed_url_response = await run_blocking(supabase.storage.from_('construction_files').create_signed_url, storage_path, 86400)
             signed_url = signed_url_response.get('signedURL')
             
             if signed_url:
                 return RedirectResponse(url=signed_url)
             else:
                 # Fallback to direct download
-                file_data = supabase.storage.from_('construction_files').download(storage_path)
+                file_data = await run_blocking(supabase.storage.from_('construction_files').download, storage_path)
                 
                 return Response(
                     content=file_data,
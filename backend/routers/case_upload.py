@@ -3,77 +3,123 @@ Router for case upload functionality.
 Handles endpoints related to creating new cases and uploading files.
 """
 import os
-from typing import List
+import shutil
+import asyncio
+from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, File, UploadFile, HTTPException
-from supabase import create_client, Client
-from ..functions.utils import create_case_id, process_single_file_with_case, save_uploaded_file_to_temp, process_audio_for_case, \
-    cleanup_temp_file, process_image_for_case, get_case_content_from_chromadb
-from ..functions.database import create_case_in_supabase
+from ..functions.utils import create_case_id, save_uploaded_file_to_temp, process_document_for_case, process_audio_for_case, \
+    cleanup_temp_file, process_image_for_case, get_case_content_from_chromadb, delete_upload_vectors
+from ..functions.database import create_case_in_supabase, find_file_metadata, update_file_processing_status
 from ..functions.tasks import generate_tasks_with_ai, store_tasks_in_supabase
+from ..functions.text_processing import DOCLING_POOL_SIZE
+from ..functions.image_processing import IMAGE_BATCH_SIZE
+from ..functions.jobs import JobStore, JobQueue, create_job_id, JOBS_UPLOAD_DIR, \
+    QUEUED, PROCESSING, COMPLETED, FAILED, COMPLETED_WITH_ERRORS
 
 router = APIRouter(tags=["case_upload"])
 
-# Initialize Supabase client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Maximum number of files of each modality processed at the same time
+DOCUMENT_CONCURRENCY = int(os.getenv("DOCUMENT_CONCURRENCY", max(1, DOCLING_POOL_SIZE)))
+AUDIO_CONCURRENCY = int(os.getenv("AUDIO_CONCURRENCY", 3))
+# Enough images in flight to fill two vision batches at once
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", max(5, 2 * IMAGE_BATCH_SIZE)))
 
-@router.post("/create_case/")
-async def create_new_case(files: List[UploadFile] = File(default=[]), audio_files: List[UploadFile] = File(default=[]), 
-image_files: List[UploadFile] = File(default=[])):
+# Processor, concurrency limit and response key for each modality
+MODALITIES = {
+    "document": (process_document_for_case, DOCUMENT_CONCURRENCY, "documents"),
+    "audio": (process_audio_for_case, AUDIO_CONCURRENCY, "audio"),
+    "image": (process_image_for_case, IMAGE_CONCURRENCY, "images"),
+}
+
+job_store = JobStore()
+
+async def resume_interrupted_file(job: Dict[str, Any], job_file: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    Create a new case with documents and audio files.
-    All files will share the same case_id.
+    Settle a file whose processing was cut off by a restart.
+    
+    If its files row was already recorded the file is not processed again:
+    it is completed if its row is, and failed otherwise. Returns None if the
+    file should be processed again, after removing any vectors it had stored.
     """
-    if not files and not audio_files and not image_files:
-        return {"error": "At least one document or audio file must be provided"}
+    case_id = job["case_id"]
+    supabase_file = await find_file_metadata(case_id, job_file["filename"], job_file["content_hash"])
+    if supabase_file is None:
+        if job_file["upload_id"]:
+            await delete_upload_vectors(case_id, job_file["upload_id"])
+        return None
     
-    # Generate case ID for all files
-    case_id = create_case_id()
-
-    await create_case_in_supabase(case_id)
+    if supabase_file["processing_status"] == COMPLETED:
+        result = {
+            "case_id": case_id,
+            "original_filename": job_file["filename"],
+            "supabase_file_id": supabase_file["id"],
+            "storage_url": supabase_file["file_url"]
+        }
+        job_store.set_file_status(job["job_id"], job_file["file_index"], COMPLETED, result=result)
+    else:
+        if job_file["upload_id"]:
+            await delete_upload_vectors(case_id, job_file["upload_id"])
+        await update_file_processing_status(supabase_file["id"], FAILED)
+        error = "Processing was interrupted by a restart"
+        result = {"case_id": case_id, "original_filename": job_file["filename"], "error": error}
+        job_store.set_file_status(job["job_id"], job_file["file_index"], FAILED, result=result, error=error)
+    
+    cleanup_temp_file(job_file["path"])
+    return result
 
-    results = {
-        "case_id": case_id,
-        "documents": [],
-        "audio": [],
-        "images": []
-    }
+async def process_job_files(job: Dict[str, Any], modality: str) -> List[Dict[str, Any]]:
+    """
+    Process the job's files of one modality concurrently, within that modality's limit.
+    
+    A failing file is recorded as failed in its own result instead of aborting
+    the others. Files completed or failed in an earlier run are not processed
+    again, nor are files interrupted after their files row was recorded.
+    Results are returned in upload order.
+    """
+    process, limit, _ = MODALITIES[modality]
+    semaphore = asyncio.Semaphore(max(1, limit))
+    job_files = [f for f in job["files"] if f["modality"] == modality]
     
-    # Process documents if provided
-    if files:
-        for upload_file in files:
-            # Modify process_single_file to accept case_id
-            result = await process_single_file_with_case(upload_file, case_id)
-            results["documents"].append(result)
-    
-    # Process audio if provided
-    if audio_files:
-        for audio_file in audio_files:
-            # Save audio to temp
-            tmp_path = await save_uploaded_file_to_temp(audio_file)
+    async def run(job_file: Dict[str, Any]) -> Dict[str, Any]:
+        if job_file["status"] in (COMPLETED, FAILED):
+            return job_file["result"]
+        
+        async with semaphore:
             try:
-                result = await process_audio_for_case(
-                    str(tmp_path), 
-                    case_id, 
-                    audio_file.filename
-                )
-                results["audio"].append(result)
+                if job_file["status"] == PROCESSING:
+                    resumed = await resume_interrupted_file(job, job_file)
+                    if resumed is not None:
+                        return resumed
+                
+                job_store.set_file_status(job["job_id"], job_file["file_index"], PROCESSING)
+                result = await process(job_file["path"], job["case_id"], job_file["filename"], job_file["content_hash"], job_file["upload_id"])
+                job_store.set_file_status(job["job_id"], job_file["file_index"], COMPLETED, result=result)
+            except Exception as e:
+                print(f"Error processing {job_file['filename']}: {e}")
+                result = {
+                    "case_id": job["case_id"],
+                    "original_filename": job_file["filename"],
+                    "error": str(e)
+                }
+                job_store.set_file_status(job["job_id"], job_file["file_index"], FAILED, result=result, error=str(e))
             finally:
-                cleanup_temp_file(tmp_path)
+                cleanup_temp_file(job_file["path"])
+            return result
+    
+    return await asyncio.gather(*(run(job_file) for job_file in job_files))
 
-    if image_files:
-        for image_file in image_files:
-            tmp_path = await save_uploaded_file_to_temp(image_file)
-            try:
-                result = await process_image_for_case(
-                    str(tmp_path), 
-                    case_id, 
-                    image_file.filename
-                )
-                results["images"].append(result)
-            finally:
-                cleanup_temp_file(tmp_path)
+async def process_case_job(job: Dict[str, Any]) -> None:
+    """Worker entry point: process every file of a job, then generate tasks for the case"""
+    case_id = job["case_id"]
+    job_store.set_job_status(job["job_id"], PROCESSING)
+    
+    # Process documents, audio and images concurrently, each with its own limit
+    modality_results = await asyncio.gather(*(process_job_files(job, modality) for modality in MODALITIES))
+    
+    results = {"case_id": case_id}
+    for (_, _, key), modality_result in zip(MODALITIES.values(), modality_results):
+        results[key] = modality_result
+    
     try:        
         # Get all content that was just added to ChromaDB
         case_content = await get_case_content_from_chromadb(case_id)        
@@ -98,4 +144,86 @@ image_files: List[UploadFile] = File(default=[])):
             "message": str(e)
         }
     
-    return results
+    shutil.rmtree(JOBS_UPLOAD_DIR / job["job_id"], ignore_errors=True)
+    
+    has_errors = any("error" in result for key in ("documents", "audio", "images") for result in results[key])
+    job_store.set_job_status(job["job_id"], COMPLETED_WITH_ERRORS if has_errors else COMPLETED, result=results)
+
+job_queue = JobQueue(job_store, process_case_job)
+
+@router.post("/create_case/")
+async def create_new_case(files: List[UploadFile] = File(default=[]), audio_files: List[UploadFile] = File(default=[]), 
+image_files: List[UploadFile] = File(default=[])):
+    """
+    Create a new case with documents and audio files.
+    All files will share the same case_id.
+    
+    Uploads are persisted and handed to the background job queue; poll
+    /jobs/{job_id} for progress.
+    """
+    if not files and not audio_files and not image_files:
+        return {"error": "At least one document or audio file must be provided"}
+    
+    # Generate case ID for all files
+    case_id = create_case_id()
+    job_id = create_job_id()
+
+    await create_case_in_supabase(case_id)
+
+    # Persist uploads so the job can be processed after this request returns
+    job_dir = JOBS_UPLOAD_DIR / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    
+    job_files = []
+    for modality, upload_files in (("document", files), ("audio", audio_files), ("image", image_files)):
+        for upload_file in upload_files:
+            tmp_path, content_hash = await save_uploaded_file_to_temp(upload_file, directory=job_dir)
+            job_files.append({
+                "modality": modality,
+                "filename": upload_file.filename,
+                "path": str(tmp_path),
+                "content_hash": content_hash
+            })
+    
+    job_store.create_job(job_id, case_id, job_files)
+    job_queue.enqueue(job_id)
+    
+    return {
+        "case_id": case_id,
+        "job_id": job_id,
+        "status": QUEUED,
+        "status_url": f"/jobs/{job_id}"
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Report the progress of an ingestion job and each of its files"""
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    files = [
+        {
+            "filename": f["filename"],
+            "modality": f["modality"],
+            "status": f["status"],
+            "error": f["error"]
+        }
+        for f in job["files"]
+    ]
+    
+    return {
+        "job_id": job["job_id"],
+        "case_id": job["case_id"],
+        "status": job["status"],
+        "progress": {
+            "total": len(files),
+            "completed": len([f for f in files if f["status"] == COMPLETED]),
+            "failed": len([f for f in files if f["status"] == FAILED]),
+            "processing": len([f for f in files if f["status"] == PROCESSING]),
+            "queued": len([f for f in files if f["status"] == QUEUED])
+        },
+        "files": files,
+        "result": job["result"],
+        "error": job["error"]
+    }
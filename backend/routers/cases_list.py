@@ -2,26 +2,22 @@
 Router for cases listing functionality.
 Handles endpoints related to listing and deleting cases.
 """
-import os
-from fastapi import APIRouter, HTTPException
-from supabase import create_client, Client
+from fastapi import APIRouter, HTTPException, Depends
+from supabase import Client
 from ..functions.utils import delete_case_completely
+from ..functions.executor import run_blocking
+from ..functions.services import get_supabase
 
 router = APIRouter(tags=["cases_list"])
 
-# Initialize Supabase client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 @router.get("/cases")
-async def list_cases(limit: int = 10, offset: int = 0):
+async def list_cases(limit: int = 10, offset: int = 0, supabase: Client = Depends(get_supabase)):
     """Case listing with file and task counts"""
-    cases = supabase.table('cases')\
+    cases = await run_blocking(supabase.table('cases')\
         .select("id, created_at")\
         .order('created_at', desc=True)\
         .range(offset, offset + limit - 1)\
-        .execute()
+        .execute)
     
     # Enhance each case with file and task counts
     enhanced_cases = []
@@ -29,10 +25,10 @@ async def list_cases(limit: int = 10, offset: int = 0):
         case_id = case['id']
         
         # Get files for this case
-        files = supabase.table('files').select("file_type").eq('case_id', case_id).execute()
+        files = await run_blocking(supabase.table('files').select("file_type").eq('case_id', case_id).execute)
         
         # Get tasks for this case
-        tasks = supabase.table('tasks').select("id").eq('case_id', case_id).execute()
+        tasks = await run_blocking(supabase.table('tasks').select("id").eq('case_id', case_id).execute)
         
         # Add file and task information
         case['files'] = files.data
@@ -8,6 +8,7 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 from smolagents import Tool, ToolCallingAgent, HfApiModel, LiteLLMModel
 from ..functions.agents import SearchDocumentsTool, CaseDetailsTool, TaskAnalysisTool, ListCasesTool
+from ..functions.executor import run_agent
 
 router = APIRouter(tags=["chat_interface"])
 
@@ -17,12 +18,15 @@ search_tool = SearchDocumentsTool()
 list_cases_tool = ListCasesTool()
 task_tool = TaskAnalysisTool()
 
-# Initialize model and agent
+# Initialize model
 model = LiteLLMModel(model_id="gpt-4", api_key=os.getenv("OPENAI_API"))
-agent = ToolCallingAgent(
-    tools=[case_details_tool, search_tool, list_cases_tool, task_tool],
-    model=model,
-)
+
+def build_agent() -> ToolCallingAgent:
+    """Create an agent per request, since an agent's memory is not safe to share across concurrent runs"""
+    return ToolCallingAgent(
+        tools=[case_details_tool, search_tool, list_cases_tool, task_tool],
+        model=model,
+    )
 
 class QueryRequest(BaseModel):
     query: str
@@ -31,8 +35,9 @@ class QueryRequest(BaseModel):
 async def intelligent_query(request: QueryRequest):
     """Single endpoint that handles all queries intelligently"""
     try:
-        # Let the agent handle everything
-        result = agent.run(request.query)
+        # Let the agent handle everything, off the event loop
+        agent = build_agent()
+        result = await run_agent(agent.run, request.query)
         
         return {
             "query": request.query,
@@ -0,0 +1,85 @@
+"""
+Recall@k versus memory for the vector storage options.
+
+Compares the case index as float32 (exact), float16 and int8 codes
+re-scored from a memory-mapped file at several re-scoring factors, and
+the persistent int8 vector store (VECTOR_STORE=quantized), against exact
+float32 search as ground truth.
+
+    python benchmark_quantization.py --n 5000 --k 10
+    python benchmark_quantization.py --case-id <case id>   # a real case from the vector store
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from backend.functions.case_index import CaseIndex
+from backend.functions.quantized_vectors import QuantizedVectors, QuantizedVectorStore
+
+
+def synthetic_embeddings(n: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit-length vectors around a few topics, roughly like embeddings of one case's chunks"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    points = centers[rng.integers(clusters, size=n)] + rng.normal(scale=0.8, size=(n, dimension))
+    points /= np.linalg.norm(points, axis=1, keepdims=True)
+    return points.astype(np.float32)
+
+
+def case_embeddings(case_id: str) -> np.ndarray:
+    from backend.functions.services import get_vector_db
+    records = get_vector_db().get(case_id=case_id, where={"case_id": case_id}, include=["embeddings"])
+    return np.asarray(records['embeddings'], dtype=np.float32)
+
+
+def run(name: str, search, queries: np.ndarray, truth: np.ndarray, k: int, nbytes: int) -> None:
+    found, elapsed = [], 0.0
+    for query in queries:
+        start = time.perf_counter()
+        found.append(search(query))
+        elapsed += time.perf_counter() - start
+    recall = np.mean([len(set(rows[:k]) & set(expected)) / k for rows, expected in zip(found, truth)])
+    print(f"{name:<22} {nbytes / 2**20:>10.2f} {recall:>10.4f} {elapsed / len(queries) * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--case-id", help="benchmark the embeddings of this case instead of synthetic data")
+    parser.add_argument("--n", type=int, default=5000, help="synthetic vectors")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 2, 4, 8], help="int8 re-scoring factors")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    embeddings = case_embeddings(args.case_id) if args.case_id else synthetic_embeddings(args.n, args.dimension, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    # Queries near stored chunks, as questions about a case's contents are
+    queries = embeddings[rng.integers(len(embeddings), size=args.queries)] + rng.normal(scale=0.02, size=(args.queries, embeddings.shape[1])).astype(np.float32)
+    k = min(args.k, len(embeddings))
+
+    ids = [str(i) for i in range(len(embeddings))]
+    blanks = [""] * len(ids)
+    metadatas = [{} for _ in ids]
+    exact = CaseIndex(ids, embeddings, blanks, metadatas, dtype="float32")
+    truth = [exact._search(query, k, None)[0] for query in queries]
+
+    print(f"{len(embeddings)} vectors x {embeddings.shape[1]} dimensions, {len(queries)} queries, k={k}")
+    print(f"{'storage':<22} {'memory MB':>10} {'recall@k':>10} {'ms/query':>10}")
+    for dtype in ("float32", "float16"):
+        index = CaseIndex(ids, embeddings, blanks, metadatas, dtype=dtype)
+        run(dtype, lambda query: index._search(query, k, None)[0], queries, truth, k, index.nbytes)
+    for factor in args.factors:
+        quantized = QuantizedVectors(embeddings, rescore_factor=factor)
+        run(f"int8, re-score {factor}k", lambda query: quantized.search(query, k)[0], queries, truth, k, quantized.nbytes)
+    with tempfile.TemporaryDirectory() as directory:
+        store = QuantizedVectorStore(directory, dimension=embeddings.shape[1])
+        store.upsert(ids, embeddings)
+        rows = {record_id: i for i, record_id in enumerate(ids)}
+        run("int8 vector store", lambda query: [rows[record_id] for record_id in store.search(query, k)[0]], queries, truth, k, store.stats()["memory_bytes"])
+
+
+if __name__ == "__main__":
+    main()
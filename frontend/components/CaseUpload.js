@@ -108,10 +108,18 @@ export default function CaseUpload({ onCaseCreated }) {
         formData.append('image_files', file);
       });
 
-      setUploadProgress('Uploading and processing files...');
-      const result = await apiClient.createCase(formData);
+      setUploadProgress('Uploading files...');
+      const job = await apiClient.createCase(formData);
       
-      setUploadProgress('Generating AI tasks...');
+      // Processing runs in the background; poll the job until it finishes
+      let status = await apiClient.getJobStatus(job.job_id);
+      while (status.status === 'queued' || status.status === 'processing') {
+        const { completed, failed, total } = status.progress;
+        setUploadProgress(`Processing files (${completed + failed}/${total})...`);
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        status = await apiClient.getJobStatus(job.job_id);
+      }
+      const result = status.result || { case_id: job.case_id };
       
       // Reset form
       setFiles([]);
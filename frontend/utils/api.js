@@ -30,6 +30,21 @@ class ApiClient {
     }
   }
 
+  async getJobStatus(jobId) {
+    try {
+      const response = await fetch(`${this.baseURL}/jobs/${jobId}`);
+      
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      
+      return response.json();
+    } catch (error) {
+      console.error('Error fetching job status:', error);
+      throw error;
+    }
+  }
+
   async getCases(limit = 10, offset = 0) {
     try {
       console.log('Fetching cases from:', `${this.baseURL}/cases?limit=${limit}&offset=${offset}`);